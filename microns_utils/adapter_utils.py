@@ -11,12 +11,17 @@ from collections import namedtuple
 import pickle
 from datetime import datetime
 import logging
+import re
 import pandas as pd
 
 from .filepath_utils import validate_filepath
 
 logger = logging.getLogger(__name__)
 
+mesh_timestamp_fmt = "%Y-%m-%d_%H:%M:%S"
+_mesh_timestamp_re = re.compile(r'^(\d{4})-(\d{1,2})-(\d{1,2})_(\d{1,2}):(\d{1,2}):(\d{1,2})$')
+_mmap_modes = ('r', 'c') # modes that can't write to the hdf5 file
+
 
 class Adapter(dj.AttributeAdapter):
     attribute_type = ''
@@ -35,11 +40,20 @@ class FilePathAdapter(Adapter):
 
 
 class PickleAdapter(Adapter):
+    """
+    Pickles objects with the highest available protocol. Protocol 5 writes numpy array buffers 
+        directly into the pickle instead of copying them through tobytes first.
+
+    To use a different pickle-compatible serializer (e.g. cloudpickle), subclass and set serializer.
+    """
+    serializer = pickle
+    protocol = pickle.HIGHEST_PROTOCOL
+
     def put(self, object):
-        return pickle.dumps(object)
+        return self.serializer.dumps(object, protocol=self.protocol)
 
     def get(self, pickled):
-        return pickle.loads(pickled)
+        return self.serializer.loads(pickled)
 
 
 class PickleFilepathAdapter(FilePathAdapter):
@@ -52,7 +66,7 @@ class PickleFilepathAdapter(FilePathAdapter):
 class MeshAdapter(FilePathAdapter):
     def get(self, filepath):
         filepath = super().get(filepath)
-        return adapt_mesh_hdf5(filepath, filepath_has_timestamp=True)
+        return adapt_mesh_hdf5(filepath, filepath_has_timestamp=True, writeable=False)
 
 
 class NumpyAdapter(FilePathAdapter):
@@ -74,7 +88,154 @@ class JsonAdapter(FilePathAdapter):
             return json.load(f)
 
 
-def adapt_mesh_hdf5(filepath, parse_filepath_stem=True, filepath_has_timestamp=False, separator='__', timestamp_fmt="%Y-%m-%d_%H:%M:%S", return_type='namedtuple', as_lengths=False):
+class LazyMesh:
+    """
+    Mesh with the same fields as the namedtuple returned by adapt_mesh_hdf5, 
+        except vertices and faces are only read from the hdf5 file on first access and then cached.
+    """
+    __slots__ = ('filepath', 'segment_id', 'timestamp', 'vertices_dtype', 'faces_dtype', 'mmap_mode', 'writeable', '_vertices', '_faces')
+
+    def __init__(self, filepath, segment_id, timestamp, vertices_dtype=np.float64, faces_dtype=np.uint32, mmap_mode=None, writeable=True):
+        self.filepath = Path(filepath)
+        self.segment_id = segment_id
+        self.timestamp = timestamp
+        self.vertices_dtype = vertices_dtype
+        self.faces_dtype = faces_dtype
+        self.mmap_mode = mmap_mode
+        self.writeable = writeable
+        self._vertices = None
+        self._faces = None
+
+    @property
+    def vertices(self):
+        if self._vertices is None:
+            with h5py.File(self.filepath, 'r') as f:
+                self._vertices = _read_hdf5_dataset(f['vertices'], dtype=self.vertices_dtype, mmap_mode=self.mmap_mode, writeable=self.writeable)
+        return self._vertices
+
+    @property
+    def faces(self):
+        if self._faces is None:
+            with h5py.File(self.filepath, 'r') as f:
+                self._faces = _read_hdf5_dataset(f['faces'], shape=_faces_shape(f['faces']), dtype=self.faces_dtype, mmap_mode=self.mmap_mode, writeable=self.writeable)
+        return self._faces
+
+
+def _faces_shape(dataset):
+    """
+    Returns the (N x 3) shape of a faces dataset, which may be stored on disk either as N x 3 or flattened.
+    """
+    return dataset.shape if dataset.ndim == 2 else (dataset.size // 3, 3)
+
+
+def _validate_mmap_mode(mmap_mode):
+    if mmap_mode not in _mmap_modes:
+        raise ValueError(f'mmap_mode must be one of {_mmap_modes}, got {mmap_mode!r}.')
+
+
+def _memmap_hdf5_dataset(dataset, shape=None, mode='r'):
+    """
+    Memory-maps an h5py dataset straight from its file without copying.
+
+    Only datasets stored contiguously (not chunked, not compressed) with a fixed-size dtype can be mapped.
+
+    :param dataset: (h5py.Dataset) dataset to map
+    :param shape: (tuple) shape of the returned array. Must have the same number of elements as the dataset. 
+        Default (None) is the dataset shape.
+    :param mode: (str) "r" (read-only) or "c" (copy-on-write, changes are kept in memory and never written to the file). 
+        Modes that write to the file ("r+", "w+") are not accepted, as they would bypass HDF5 and can corrupt the file.
+    :returns: np.memmap if the dataset can be mapped, otherwise None
+    """
+    _validate_mmap_mode(mode)
+    if dataset.chunks is not None or dataset.compression is not None or dataset.dtype.hasobject or dataset.size == 0:
+        return None
+    if dataset.id.get_create_plist().get_layout() != h5py.h5d.CONTIGUOUS:
+        return None
+    offset = dataset.id.get_offset()
+    if offset is None:
+        return None
+    return np.memmap(dataset.file.filename, dtype=dataset.dtype, mode=mode, offset=offset, shape=dataset.shape if shape is None else shape)
+
+
+def _read_hdf5_dataset(dataset, shape=None, dtype=None, mmap_mode=None, writeable=True):
+    """
+    Reads an h5py dataset directly into a preallocated array. 
+    
+    If dtype differs from the on-disk dtype, HDF5 performs the conversion while reading, 
+        so no intermediate array in the on-disk dtype is created.
+
+    :param dataset: (h5py.Dataset) dataset to read
+    :param shape: (tuple) shape of the returned array. Must have the same number of elements as the dataset. 
+        Default (None) is the dataset shape.
+    :param dtype: desired dtype of the returned array. Default (None) is the on-disk dtype.
+    :param mmap_mode: (str) If not None, and the dataset is contiguous on disk and already has the desired dtype, 
+        returns a np.memmap opened with this mode instead of reading into memory. 
+        Options are "r" (read-only) and "c" (copy-on-write), other modes raise ValueError.
+    :param writeable: If False, the returned array is marked read-only. 
+        If True and the array would otherwise be read-only (e.g. mmap_mode="r"), a writeable copy is returned.
+    :returns: numpy array
+    """
+    out = None
+    if mmap_mode is not None:
+        _validate_mmap_mode(mmap_mode)
+    if mmap_mode is not None and (dtype is None or np.dtype(dtype) == dataset.dtype):
+        out = _memmap_hdf5_dataset(dataset, shape=shape, mode=mmap_mode)
+    if out is None:
+        out = np.empty(dataset.shape if shape is None else shape, dtype=dataset.dtype if dtype is None else dtype)
+        if out.size > 0:
+            dataset.read_direct(out if out.shape == dataset.shape else out.reshape(dataset.shape))
+    if not writeable:
+        out.setflags(write=False)
+    elif not out.flags.writeable:
+        out = np.array(out)
+    return out
+
+
+def _parse_timestamp(timestamp, timestamp_fmt=mesh_timestamp_fmt):
+    """
+    Parses timestamp str to datetime. The default mesh timestamp format is parsed with a precompiled regex, 
+        which is much faster than datetime.strptime. Other formats fall back to datetime.strptime.
+
+    :returns: datetime if parsed successfully else None
+    """
+    try:
+        if timestamp_fmt == mesh_timestamp_fmt:
+            match = _mesh_timestamp_re.match(timestamp)
+            return datetime(*map(int, match.groups())) if match is not None else None
+        return datetime.strptime(timestamp, timestamp_fmt)
+    except ValueError:
+        return None
+
+
+def _parse_mesh_filepath_stem(stem, filepath_has_timestamp=False, separator='__', timestamp_fmt=mesh_timestamp_fmt):
+    """
+    Parses segment_id and timestamp from a mesh filepath stem. See adapt_mesh_hdf5 for params.
+
+    :returns: dict with keys segment_id and timestamp if parsed successfully else None
+    """
+    if not filepath_has_timestamp:
+        return {'segment_id': int(stem), 'timestamp': ''} if stem.isascii() and stem.isdecimal() else None
+    
+    segment_id, sep, timestamp = stem.partition(separator)
+    if not (sep and segment_id.isascii() and segment_id.isdecimal()):
+        return None
+    timestamp = _parse_timestamp(timestamp, timestamp_fmt)
+    return {'segment_id': int(segment_id), 'timestamp': timestamp} if timestamp is not None else None
+
+
+def get_mesh_lengths(filepath):
+    """
+    Returns the number of vertices and faces in a mesh hdf5 file. Only dataset metadata is read.
+
+    :param filepath: File path pointing to the hdf5 mesh file. 
+    :returns: Length of the vertex array, Length of face array
+    """
+    # rdcc_nbytes=0 skips allocating a raw data chunk cache, as no data is read
+    with h5py.File(filepath, 'r', rdcc_nbytes=0) as f:
+        return f['vertices'].shape[0], _faces_shape(f['faces'])[0]
+
+
+def adapt_mesh_hdf5(filepath, parse_filepath_stem=True, filepath_has_timestamp=False, separator='__', timestamp_fmt=mesh_timestamp_fmt, return_type='namedtuple', as_lengths=False, vertices_dtype=np.float64, faces_dtype=np.uint32, mmap_mode=None, writeable=True):
     """
     Reads from a mesh hdf5 and returns vertices, faces and additional information in the form of a namedtuple or optionally
         as a dictionary, or optionally as separate variables.
@@ -97,6 +258,7 @@ def adapt_mesh_hdf5(filepath, parse_filepath_stem=True, filepath_has_timestamp=F
             filepath = filepath of mesh
         }
         dict = return a dictionary with keys as in namedtuple
+        lazy = return a LazyMesh with fields as in namedtuple, where vertices and faces are only read on first access
         separate: returns separate variables in the following order {
             vertex array 
             face array
@@ -107,38 +269,40 @@ def adapt_mesh_hdf5(filepath, parse_filepath_stem=True, filepath_has_timestamp=F
             Length of face array
             dictionary with keys segment_id, timestamp, filepath as in namedtuple
         This is done without pulling the mesh into memory, which makes it far more space and time efficient.
+        To get only the lengths without parsing the filepath, use get_mesh_lengths.
+    :param vertices_dtype: dtype of the returned vertex array. If None, the on-disk dtype is kept and no conversion is done.
+    :param faces_dtype: dtype of the returned face array. If None, the on-disk dtype is kept and no conversion is done.
+    :param mmap_mode: If not None, vertices and faces that are stored contiguously on disk and need no dtype conversion 
+        are returned as np.memmap arrays opened with this mode instead of being read into memory. 
+        Options are "r" (read-only) and "c" (copy-on-write, changes are never written to the file), other modes raise ValueError. 
+        Chunked or compressed datasets are always read into memory. Read-only modes (e.g. "r") need writeable=False to avoid a copy.
+    :param writeable: If False, vertices and faces are returned as read-only arrays, which combined with mmap_mode="r" 
+        avoids copying the mesh into memory at all. If True, a writeable copy is made of any array that would otherwise be read-only.
     }
     """
     Mesh = namedtuple('Mesh', ['vertices', 'faces', 'segment_id', 'timestamp', 'filepath'])
     filepath = Path(filepath)
     
     # try to parse filepath
-    info_dict = {'filepath': filepath}
-    defaults = {'segment_id': np.nan, 'timestamp': ''}
+    info_dict = {'filepath': filepath, 'segment_id': np.nan, 'timestamp': ''}
     if parse_filepath_stem:
-        try:
-            if not filepath_has_timestamp:
-                segment_id = filepath.stem
-                info_dict.update({**{'segment_id': int(segment_id), 'timestamp': ''}})
-            else:
-                segment_id, timestamp = filepath.stem.split(separator)
-                timestamp = datetime.strptime(timestamp, timestamp_fmt)
-                info_dict.update({**{'segment_id': int(segment_id), 'timestamp': timestamp}})
-        except:
-            info_dict.update({**defaults})
+        parsed = _parse_mesh_filepath_stem(filepath.stem, filepath_has_timestamp=filepath_has_timestamp, separator=separator, timestamp_fmt=timestamp_fmt)
+        if parsed is not None:
+            info_dict.update(parsed)
+        else:
             logger.warning('Could not parse mesh filepath.')
-    else:
-        info_dict.update({**defaults})
+
+    if as_lengths:
+        n_vertices, n_faces = get_mesh_lengths(filepath)
+        return n_vertices, n_faces, info_dict
+
+    if return_type == 'lazy':
+        return LazyMesh(**info_dict, vertices_dtype=vertices_dtype, faces_dtype=faces_dtype, mmap_mode=mmap_mode, writeable=writeable)
 
     # Load the mesh data
     with h5py.File(filepath, 'r') as f:
-        if as_lengths:
-            n_vertices = f['vertices'].shape[0]
-            n_faces = int(f['faces'].shape[0] / 3)
-            return n_vertices, n_faces, info_dict
-        
-        vertices = f['vertices'][()].astype(np.float64)
-        faces = f['faces'][()].reshape(-1, 3).astype(np.uint32)
+        vertices = _read_hdf5_dataset(f['vertices'], dtype=vertices_dtype, mmap_mode=mmap_mode, writeable=writeable)
+        faces = _read_hdf5_dataset(f['faces'], shape=_faces_shape(f['faces']), dtype=faces_dtype, mmap_mode=mmap_mode, writeable=writeable)
     
     # Return options
     return_dict = dict(
@@ -6,7 +6,11 @@ CAVE (https://pypi.org/project/caveclient/)
 NeuroglancerAnnotationUI (https://github.com/seung-lab/NeuroglancerAnnotationUI)
 """
 
+import functools
 import logging
+import threading
+from collections import OrderedDict
+import numpy as np
 from datajoint_plus.utils import wrap
 from cloudvolume import CloudVolume
 from caveclient import CAVEclient
@@ -19,7 +23,40 @@ m65_internal = 'minnie65_phase3_v1'
 m35_public = 'minnie35_public_v0'
 m35_internal = 'minnie35_phase3_v0'
 
-def set_CAVEclient(datastack='m65_public', ver=None, caveclient_kws=None):
+_datastack_mapping = {
+    'm65_public': m65_public,
+    'm65_internal': m65_internal,
+    'm35_public': m35_public,
+    'm35_internal': m35_internal
+}
+
+_CAVEclient_cache = {}
+cave_query_cache_maxsize = 128 # number of query results kept by _query_CAVE_table, least recently used are evicted first
+_CAVE_query_cache = OrderedDict()
+_CAVE_query_cache_lock = threading.Lock()
+
+
+def _kws_cache_key(kws):
+    """
+    Returns a hashable key for a dict of kwargs, or None if any value is unhashable.
+    """
+    try:
+        key = frozenset(({} if kws is None else kws).items())
+        hash(key)
+        return key
+    except TypeError:
+        return None
+
+
+@functools.lru_cache(maxsize=32)
+def _get_cloudvolume(cv_path, **cloudvolume_kws):
+    """
+    Returns a CloudVolume, reusing a previously constructed one if the same arguments were passed.
+    """
+    return CloudVolume(cv_path, **cloudvolume_kws)
+
+
+def set_CAVEclient(datastack='m65_public', ver=None, caveclient_kws=None, use_cache=True):
     """
     Sets CAVE client
 
@@ -34,18 +71,18 @@ def set_CAVEclient(datastack='m65_public', ver=None, caveclient_kws=None):
         default (None) -> latest version
 
     :param caveclient_kws: kwargs to pass to CAVEclient
+    :param use_cache: If True and ver is provided, returns the client previously instantiated with the same datastack, ver and caveclient_kws if available.
+        Clients with ver=None (latest version) and unauthorized clients are never cached. 
+        Cached clients are shared between callers, so their materialization version should not be changed. See clear_CAVEclient_cache.
 
     :returns: CAVEclient object
     """
-    datastack_mapping = {
-        'm65_public': m65_public,
-        'm65_internal': m65_internal,
-        'm35_public': m35_public,
-        'm35_internal': m35_internal
-    }
+    datastack = _datastack_mapping.get(datastack, datastack)
 
-    if datastack in datastack_mapping:
-        datastack = datastack_mapping[datastack]
+    cache_key = (datastack, ver, _kws_cache_key(caveclient_kws))
+    use_cache = use_cache and ver is not None and cache_key[-1] is not None
+    if use_cache and cache_key in _CAVEclient_cache:
+        return _CAVEclient_cache[cache_key]
     
     try:
         client = CAVEclient(datastack, **{} if caveclient_kws is None else caveclient_kws)
@@ -78,6 +115,9 @@ def set_CAVEclient(datastack='m65_public', ver=None, caveclient_kws=None):
             logging.exception('Could not set materialization version.')
             raise Exception('Could not set materialization version.')
 
+    if use_cache:
+        _CAVEclient_cache[cache_key] = client
+
     try:
         logger.info(f'Instantiated CAVE client with datastack "{client.info.datastack_name}" and version: {client.materialize.version}. Most recent version: {client.materialize.most_recent_version()}')
     except:
@@ -86,8 +126,17 @@ def set_CAVEclient(datastack='m65_public', ver=None, caveclient_kws=None):
     return client
 
 
+def clear_CAVEclient_cache():
+    """
+    Clears the clients cached by set_CAVEclient, so that later calls instantiate new clients.
+    """
+    _CAVEclient_cache.clear()
+
+
 class CAVEClient:
     _client = None
+    _lock = threading.Lock()
+    _thread_local = threading.local()
 
     @classproperty
     def client_ver(cls):
@@ -98,17 +147,47 @@ class CAVEClient:
         cls._client = set_CAVEclient(
             datastack=datastack,
             ver=ver,
-            caveclient_kws=caveclient_kws
+            caveclient_kws=caveclient_kws,
+            use_cache=False
         )
 
     @classproperty
     def client(cls):
         if cls._client is None:
-            cls.set_client()
+            with cls._lock:
+                if cls._client is None:
+                    cls.set_client()
         return cls._client
 
+    @classproperty
+    def thread_local_client(cls):
+        """
+        Client instantiated once per thread, for use where a client must not be shared across threads.
+        """
+        client = getattr(cls._thread_local, 'client', None)
+        if client is None:
+            client = cls._thread_local.client = set_CAVEclient(datastack='m65_internal', use_cache=False)
+        return client
+
 
-def get_stats_from_cv_path(cv_path, mip=None):
+def _get_stats_for_mip(cv, mip):
+    """
+    Returns a dict of stats for one mip of a CloudVolume. See get_stats_from_cv_path.
+    """
+    bounds = cv.mip_bounds(mip)
+    min_pt = bounds.minpt
+    max_pt = bounds.maxpt
+    return {
+            'mip' : mip,
+            'res' : cv.mip_resolution(mip),
+            'min_pt' : min_pt,
+            'max_pt' : max_pt,
+            'ctr_pt' : ((max_pt - min_pt) / 2) + min_pt,
+            'voxel_offset' : cv.mip_voxel_offset(mip)
+        }
+
+
+def get_stats_from_cv_path(cv_path, mip=None, progress=False):
     """
     Given a cloudvolume path and optional mip (default = all), returns a dict with the following stats from cloudvolume:
         - res: resolution
@@ -119,47 +198,113 @@ def get_stats_from_cv_path(cv_path, mip=None):
     
     :param cv_path (str): CloudVolume path
     :param mip (int): the mip to get stats for. default is None.
+    :param progress (bool): if True, CloudVolume shows progress bars. default is False.
 
     :returns: 
         - If mip=None, list of dictionaries for all mips.
         - If mip is specified, dictionaries with stats.  
     """
-    def get_stats_for_mip(mip):
-        res = cv.mip_resolution(mip)
-        min_pt = cv.mip_bounds(mip).minpt
-        max_pt = cv.mip_bounds(mip).maxpt
-        ctr_pt = ((max_pt - min_pt) / 2) + min_pt
-        voxel_offset = cv.mip_voxel_offset(mip)
-
-        return {
-                'mip' : mip,
-                'res' : res,
-                'min_pt' : min_pt,
-                'max_pt' : max_pt,
-                'ctr_pt' : ctr_pt,
-                'voxel_offset' : voxel_offset
-            }
+    cv = _get_cloudvolume(cv_path, use_https=True, progress=progress)
 
-    cv = CloudVolume(cv_path, use_https=True, progress=True)
+    return _get_stats_for_mip(cv, mip) if mip is not None else [_get_stats_for_mip(cv, mip) for mip in list(cv.available_mips)]
 
-    return get_stats_for_mip(mip) if mip is not None else [get_stats_for_mip(mip) for mip in list(cv.available_mips)]
 
-
-def get_stack_from_cv_path(cv_path, mip, seg_ids=None):
+def get_stack_from_cv_path(cv_path, mip, seg_ids=None, progress=False):
     """
     Given a cloudvolume path and mip returns the data stack from cloudvolume.
 
     :param cv_path (str): CloudVolume path
     :param mip (int): the mip to get stack for
     :param seg_ids (int): optional, the seg_ids to restrict to
+    :param progress (bool): if True, CloudVolume shows a download progress bar. default is False.
 
     :returns: data stack
     """
-    cv = CloudVolume(cv_path, use_https=True, progress=True, fill_missing=True, mip=mip)
+    cv = _get_cloudvolume(cv_path, use_https=True, progress=progress, fill_missing=True, mip=mip)
     return cv.download(bbox=cv.bounds, segids=None if seg_ids is None else wrap(seg_ids)).squeeze()
 
 
-def query_nucleus_id_in_CAVE(nucleus_id, table_name=None, set_CAVEclient_kws=None, client=None):
+def _format_ids(ids):
+    """
+    Returns a sorted tuple of unique ints given a single id or an array-like of ids.
+    """
+    return tuple(sorted({int(i) for i in np.atleast_1d(ids).ravel()}))
+
+
+def _query_CAVE_table(client, table_name, column, values, use_cache=True):
+    """
+    Queries a CAVE table for all rows where column is in values with a single request.
+    
+    If use_cache is True, results are memoized per client, materialization version, table_name, column and values. 
+    Up to cave_query_cache_maxsize results are kept, see clear_CAVE_query_cache.
+    """
+    key = (id(client), client.materialize.version, table_name, column, values) if use_cache else None
+    cached = None
+    if use_cache:
+        with _CAVE_query_cache_lock:
+            cached = _CAVE_query_cache.get(key)
+            if cached is not None:
+                _CAVE_query_cache.move_to_end(key)
+    if cached is None or cached[0] is not client:
+        cached = (client, client.materialize.query_table(table_name, filter_in_dict={column: list(values)}))
+        if use_cache:
+            with _CAVE_query_cache_lock:
+                _CAVE_query_cache[key] = cached
+                _CAVE_query_cache.move_to_end(key)
+                while len(_CAVE_query_cache) > cave_query_cache_maxsize:
+                    _CAVE_query_cache.popitem(last=False)
+    return cached[1].copy()
+
+
+def clear_CAVE_query_cache():
+    """
+    Clears the query results memoized by query_nucleus_ids_in_CAVE and query_segment_ids_in_CAVE.
+    """
+    with _CAVE_query_cache_lock:
+        _CAVE_query_cache.clear()
+
+
+def _resolve_CAVEclient(set_CAVEclient_kws=None, client=None):
+    if (set_CAVEclient_kws is not None) and (client is not None):
+        logger.warning('when both set_CAVEclient_kws and client are passed set_CAVEclient_kws will be ignored')
+    return client if client is not None else set_CAVEclient(**set_CAVEclient_kws if set_CAVEclient_kws is not None else {})
+
+
+def query_nucleus_ids_in_CAVE(nucleus_ids, table_name=None, set_CAVEclient_kws=None, client=None, use_cache=True):
+    """
+    Queries nucleus_detection_v0 or user provided table in CAVE with one or more nucleus_ids in a single request
+
+    :param nucleus_ids (int or array-like): nucleus_id(s) to query
+    :param table_name (str): table in CAVE to query
+        default is nucleus_detection_v0
+    :param set_CAVEclient (dict): - keywords to pass to set_CAVEclient
+        ignored if client is provided
+    :param client (CAVEclient): client to use for the query
+    :param use_cache (bool): if True, repeated queries with the same client, table and ids are served from memory
+    """
+    client = _resolve_CAVEclient(set_CAVEclient_kws=set_CAVEclient_kws, client=client)
+    df = _query_CAVE_table(client, 'nucleus_detection_v0' if table_name is None else table_name, 'id', _format_ids(nucleus_ids), use_cache=use_cache)
+    return df.rename(columns={'id': 'nucleus_id', 'pt_root_id': 'segment_id'})
+
+
+def query_segment_ids_in_CAVE(segment_ids, table_name=None, set_CAVEclient_kws=None, client=None, use_cache=True):
+    """
+    Queries nucleus_detection_v0 or user provided table in CAVE with one or more segment_ids in a single request
+
+    :param segment_ids (int or array-like): segment_id(s) to query
+    :param table_name (str): table in CAVE to query
+        default is nucleus_detection_v0
+    :param set_CAVEclient (dict): - keywords to pass to set_CAVEclient
+        ignored if client is provided
+    :param client (CAVEclient): client to use for the query
+    :param use_cache (bool): if True, repeated queries with the same client, table and ids are served from memory
+    """
+    client = _resolve_CAVEclient(set_CAVEclient_kws=set_CAVEclient_kws, client=client)
+    df = _query_CAVE_table(client, 'nucleus_detection_v0' if table_name is None else table_name, 'pt_root_id', _format_ids(segment_ids), use_cache=use_cache)
+    return df.rename(columns={'id': 'nucleus_id', 'pt_root_id': 'segment_id'})
+
+
+def query_nucleus_id_in_CAVE(nucleus_id, table_name=None, set_CAVEclient_kws=None, client=None, use_cache=True):
     """
     Queries nucleus_detection_v0 or user provided table in CAVE with the given nucleus_id
 
@@ -169,15 +314,12 @@ def query_nucleus_id_in_CAVE(nucleus_id, table_name=None, set_CAVEclient_kws=Non
     :param set_CAVEclient (dict): - keywords to pass to set_CAVEclient
         ignored if client is provided
     :param client (CAVEclient): client to use for the query
+    :param use_cache (bool): if True, repeated queries with the same client, table and id are served from memory
     """
-    if (set_CAVEclient_kws is not None) and (client is not None):
-        logger.warning('when both set_CAVEclient_kws and client are passed set_CAVEclient_kws will be ignored')
-    client = client if client is not None else set_CAVEclient(**set_CAVEclient_kws if set_CAVEclient_kws is not None else {})
-    df = client.materialize.query_table('nucleus_detection_v0' if table_name is None else table_name, filter_equal_dict={'id': nucleus_id}).rename(columns={'id': 'nucleus_id', 'pt_root_id': 'segment_id'})
-    return df
+    return query_nucleus_ids_in_CAVE(nucleus_id, table_name=table_name, set_CAVEclient_kws=set_CAVEclient_kws, client=client, use_cache=use_cache)
 
 
-def query_segment_id_in_CAVE(segment_id, table_name=None, set_CAVEclient_kws=None, client=None):
+def query_segment_id_in_CAVE(segment_id, table_name=None, set_CAVEclient_kws=None, client=None, use_cache=True):
     """
     Queries nucleus_detection_v0 or user provided table in CAVE with the given segment_id
 
@@ -187,9 +329,6 @@ def query_segment_id_in_CAVE(segment_id, table_name=None, set_CAVEclient_kws=Non
     :param set_CAVEclient (dict): - keywords to pass to set_CAVEclient
         ignored if client is provided
     :param client (CAVEclient): client to use for the query
+    :param use_cache (bool): if True, repeated queries with the same client, table and id are served from memory
     """
-    if (set_CAVEclient_kws is not None) and (client is not None):
-        logger.warning('when both set_CAVEclient_kws and client are passed set_CAVEclient_kws will be ignored')
-    client = client if client is not None else set_CAVEclient(**set_CAVEclient_kws if set_CAVEclient_kws is not None else {})
-    df = client.materialize.query_table('nucleus_detection_v0' if table_name is None else table_name, filter_equal_dict={'pt_root_id': segment_id}).rename(columns={'id': 'nucleus_id', 'pt_root_id': 'segment_id'})
-    return df
\ No newline at end of file
+    return query_segment_ids_in_CAVE(segment_id, table_name=table_name, set_CAVEclient_kws=set_CAVEclient_kws, client=client, use_cache=use_cache)
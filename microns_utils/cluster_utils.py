@@ -2,7 +2,7 @@ import numpy as np
 from sklearn.cluster import DBSCAN
 
 
-def cluster_point_cloud(points, eps=5000, min_samples=2, algorithm='auto', return_indices=False):
+def cluster_point_cloud(points, eps=5000, min_samples=2, algorithm='ball_tree', leaf_size=30, n_jobs=-1, return_indices=False):
     """
     Cluster a point cloud using DBSCAN algorithm.
 
@@ -10,26 +10,34 @@ def cluster_point_cloud(points, eps=5000, min_samples=2, algorithm='auto', retur
     - points: An Nx3 array of points.
     - eps: The maximum distance between two samples for one to be considered as in the neighborhood of the other.
     - min_samples: The number of samples (or total weight) in a neighborhood for a point to be considered as a core point. This includes the point itself.
+    - algorithm: The algorithm sklearn uses to compute nearest neighbors. Defaults to "ball_tree".
+    - leaf_size: Leaf size passed to the ball_tree or kd_tree. Values around 30-40 work well for 3D point clouds.
+    - n_jobs: The number of parallel jobs for the neighbor queries. -1 uses all processors.
     - return_indices: Whether to return the indices of the points in each cluster.
 
     Returns:
     - clusters: A list of clusters, where each cluster is a numpy array of shape Mx3, and M is the number of points in the cluster.
     - cluster_indices: A list of clusters, where each cluster is a numpy array of shape M, and M is the number of points in the cluster. Only returned if return_indices is True.
     """
-    # Fit DBSCAN
-    db = DBSCAN(eps=eps, min_samples=min_samples, algorithm=algorithm).fit(points)
+    points = np.asarray(points)
+
+    # Fit DBSCAN on a float32 copy to halve the memory of the neighbor tree and distance computations.
+    # For very large point clouds, consider hdbscan or cuml.DBSCAN instead.
+    db = DBSCAN(eps=eps, min_samples=min_samples, algorithm=algorithm, leaf_size=leaf_size, n_jobs=n_jobs).fit(np.ascontiguousarray(points, dtype=np.float32))
     
     # Get labels
     labels = db.labels_
 
-    # Number of clusters in labels, ignoring noise if present.
-    n_clusters = len(set(labels)) - (1 if -1 in labels else 0)
-    
+    # Group point indices by label with a single stable sort. Noise (label -1) sorts first and is dropped.
+    order = np.argsort(labels, kind='stable')
+    order = order[np.count_nonzero(labels == -1):]
+    bounds = np.flatnonzero(np.diff(labels[order])) + 1
+
     # Create clusters
-    clusters = [points[labels == i] for i in range(n_clusters)]
+    clusters = np.split(points[order], bounds) if order.size else []
     
     if return_indices:
-        cluster_indices = [np.where(labels == i)[0] for i in range(n_clusters)]
+        cluster_indices = np.split(order, bounds) if order.size else []
         return clusters, cluster_indices
     else:
         return clusters
\ No newline at end of file
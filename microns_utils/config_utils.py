@@ -1,7 +1,8 @@
 """
 Classes and methods for configuring microns packages.
 """
-import datajoint_plus as djp
+import sys
+import warnings
 
 class SchemaConfig:
     """
@@ -39,8 +40,19 @@ class SchemaConfig:
     
     def register_externals(self):
         if self.externals is not None:
+            import datajoint_plus as djp
             djp.register_externals(self.externals)
     
     def register_adapters(self, context=None):
+        """
+        Adds adapters to the schema context.
+
+        :param context: namespace to add adapters to. Pass globals() from the module that defines the schema.
+            Omitting context is deprecated. If omitted, the namespace of the caller is used.
+        """
+        if context is None:
+            warnings.warn('Calling register_adapters without context is deprecated. Pass context=globals().', DeprecationWarning, stacklevel=2)
+            context = sys._getframe(1).f_locals
         if self.adapters is not None:
+            import datajoint_plus as djp
             djp.add_objects(self.adapters, context=context)
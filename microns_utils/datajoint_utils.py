@@ -1,20 +1,16 @@
 """
 Base classes and methods for microns-dashboard
 """
+from datetime import timedelta
 from collections import namedtuple
-from functools import wraps
-import inspect
 import json
 from pathlib import Path
-from time import timezone
 import datajoint as dj
-import datajoint_plus as djp
-from datajoint_plus.utils import format_rows_to_df
 from datajoint_plus import base as djpb
 from datajoint_plus import user_tables as djpu
-from .misc_utils import classproperty, wrap, unwrap
+from .misc_utils import classproperty, cached_classproperty, wrap
 from .version_utils import check_package_version
-from .datetime_utils import current_timestamp
+from .datetime_utils import current_timestamp, timestamp_str
 
 
 Version = namedtuple('Version', ['id', 'version', 'timestamp'])
@@ -25,30 +21,32 @@ version_id_sqltype = "varchar(6)"
 event_id_sqltype = "varchar(12)"
 event_sqltype = "varchar(128)"
 event_handler_id_sqltype = "varchar(6)"
+_event_basedirs = {} # Event.basedir -> created Path
 
 class Base:
-    @classproperty
+    @cached_classproperty
     def definition(cls):
-        return "\n".join([l.strip() for l in [cls.default_primary_attrs, cls.extra_primary_attrs, """---""", cls.default_secondary_attrs, cls.extra_secondary_attrs]]) 
+        lines = (l.strip() for l in (cls.default_primary_attrs, cls.extra_primary_attrs, """---""", cls.default_secondary_attrs, cls.extra_secondary_attrs))
+        return "\n".join(l for l in lines if l)
     
 
 class VersionLookup(Base, djpb.BaseMaster, djpu.UserTable, dj.Lookup):
     def __init_subclass__(cls, **kwargs):
-        cls._init_validation(**kwargs)
         assert hasattr(cls, 'package'), 'subclasses of VersionLookup must implement "package"'
+        cls._init_validation(**kwargs)
     
     enable_hashing = True
     attr_name = 'version'
 
-    @classproperty
+    @cached_classproperty
     def hash_name(cls):
         return '_'.join([cls.attr_name, 'id'])
 
-    @classproperty
+    @cached_classproperty
     def hashed_attrs(cls):
         return cls.attr_name
     
-    @classproperty
+    @cached_classproperty
     def default_primary_attrs(cls):
         return f"""
         {cls.attr_name} : {version_sqltype} # package version
@@ -58,7 +56,7 @@ class VersionLookup(Base, djpb.BaseMaster, djpu.UserTable, dj.Lookup):
     def extra_primary_attrs(cls):
         return """"""
     
-    @classproperty
+    @cached_classproperty
     def default_secondary_attrs(cls):
         return f"""
         {cls.hash_name} : {version_id_sqltype} # hash of package version
@@ -86,8 +84,12 @@ class VersionLookup(Base, djpb.BaseMaster, djpu.UserTable, dj.Lookup):
 class EventLookup(Base, djpb.BaseMaster, djpu.UserTable, dj.Lookup):
     def __init_subclass__(cls, **kwargs):
         cls._init_validation(**kwargs)
+        cls._parts = None
+        cls._event_to_parts = None
 
     hash_name = 'event_id'
+    _parts = None
+    _event_to_parts = None
 
     @classmethod
     def get(cls, key):
@@ -97,7 +99,7 @@ class EventLookup(Base, djpb.BaseMaster, djpu.UserTable, dj.Lookup):
     def get1(cls, key):
         return cls.r1p(key).fetch1()
 
-    @classproperty
+    @cached_classproperty
     def default_primary_attrs(cls):
         return f"""
         {cls.hash_name} : {event_id_sqltype}
@@ -107,7 +109,7 @@ class EventLookup(Base, djpb.BaseMaster, djpu.UserTable, dj.Lookup):
     def extra_primary_attrs(cls):
         return """"""
 
-    @classproperty
+    @cached_classproperty
     def default_secondary_attrs(cls):
         return f"""
         event=NULL : {event_sqltype}
@@ -120,15 +122,37 @@ class EventLookup(Base, djpb.BaseMaster, djpu.UserTable, dj.Lookup):
 
     @classmethod
     def log_event(cls, event, attrs=None, data=None):
-        parts = [part for part in cls.parts(as_cls=True) if event in getattr(part, 'events')]
+        parts = cls._get_event_to_parts().get(event, [])
         assert len(parts) >= 1, f'No parts with event "{event}" found.'
         assert len(parts) < 2, f'Multiple parts with event "{event}" found. Parts are: {[p.class_name for p in parts]}'
         return parts[0].log_event(event, attrs=attrs, data=data)
 
+    @classmethod
+    def _get_parts(cls):
+        """
+        Returns parts(as_cls=True) as a tuple, computed on first call. Part tables are fixed once the class is declared.
+        """
+        if cls._parts is None:
+            cls._parts = tuple(cls.parts(as_cls=True))
+        return cls._parts
+
+    @classmethod
+    def _get_event_to_parts(cls):
+        """
+        Returns a dict mapping each event to the list of parts that implement it, built on first call.
+        """
+        if cls._event_to_parts is None:
+            event_to_parts = {}
+            for part in cls._get_parts():
+                for event in wrap(getattr(part, 'events', None) or ()):
+                    event_to_parts.setdefault(event, []).append(part)
+            cls._event_to_parts = event_to_parts
+        return cls._event_to_parts
+
     @classmethod
     def events(cls):
         events = []
-        for part in cls.parts(as_cls=True):
+        for part in cls._get_parts():
             if issubclass(part, Event):
                 events.extend(wrap(part.events))
         return events
@@ -136,8 +160,8 @@ class EventLookup(Base, djpb.BaseMaster, djpu.UserTable, dj.Lookup):
 
 class Event(Base, djpb.BasePart, djpu.UserTable, dj.Part):
     def __init_subclass__(cls, **kwargs):
-        cls._init_validation(**kwargs)
         assert getattr(cls, 'events', None) is not None, 'Subclasses of Event must implement "events".'
+        cls._init_validation(**kwargs)
 
     enable_hashing = True
     hash_name = 'event_id'
@@ -150,7 +174,7 @@ class Event(Base, djpb.BasePart, djpu.UserTable, dj.Part):
     file_type = None
     constant_attrs = None
 
-    @classproperty
+    @cached_classproperty
     def default_primary_attrs(cls):
         return f"""
         -> master
@@ -162,7 +186,7 @@ class Event(Base, djpb.BasePart, djpu.UserTable, dj.Part):
     def extra_primary_attrs(cls):
         return """"""
 
-    @classproperty
+    @cached_classproperty
     def default_secondary_attrs(cls):
         return f"""data=NULL : {cls.data_type} # event associated data. default=NULL"""
 
@@ -175,10 +199,13 @@ class Event(Base, djpb.BasePart, djpu.UserTable, dj.Part):
         if cls.external_type is not None:
             if cls.external_type == 'filepath':
                 required = ['basedir', 'file_type']
-                assert getattr(cls, required) is not None, f'Subclasses of Event must implement "{required}" if external_type == "filepath".'
-                basedir = Path(cls.basedir)
-                basedir.mkdir(exist_ok=True)
-                filename = basedir.joinpath(event.id).with_suffix(cls.file_type)
+                assert all(getattr(cls, r) is not None for r in required), f'Subclasses of Event must implement "{required}" if external_type == "filepath".'
+                basedir = _event_basedirs.get(cls.basedir)
+                if basedir is None:
+                    basedir = Path(cls.basedir)
+                    basedir.mkdir(exist_ok=True)
+                    _event_basedirs[cls.basedir] = basedir
+                filename = basedir.joinpath(event.id + cls.file_type)
 
                 try:
                     if cls.file_type == '.json':
@@ -196,18 +223,44 @@ class Event(Base, djpb.BasePart, djpu.UserTable, dj.Part):
     
     @classmethod
     def log_event(cls, event, attrs=None, data=None):
-        assert event in cls.events, f'event not found. events: {cls.events}'
-        timestamp = current_timestamp('US/Central', fmt="%Y-%m-%d_%H:%M:%S.%f")
-        event_id = cls.hash1({'event': event, 'timestamp': timestamp})
-        event = EventData(id=event_id, name=event, timestamp=timestamp)
-        row = {'event_id': event.id, 'event': event.name, 'timestamp': event.timestamp}
-        row.update({} if attrs is None else attrs)
-        row['data'] = cls().prepare_data(event=event, data=data)
-        cls.insert1(row=row, constant_attrs={} if cls.constant_attrs is None else cls.constant_attrs, insert_to_master=True, ignore_extra_fields=True, skip_hashing=True)
-        cls.master.Log('info',  f'Event "{event.name}" with event_id {event.id} occured at {event.timestamp}')
-        cls.master.Log('debug', f'Event "{event.name}" with event_id {event.id} occured at {event.timestamp} with insert {row}')
-        cls().on_event(event=event)
-        return event
+        return cls.log_events([event], attrs=[attrs], data=[data])[0]
+
+    @classmethod
+    def log_events(cls, events, attrs=None, data=None):
+        """
+        Logs multiple events with a single insert.
+
+        :param events (list): event names. each must be in cls.events.
+        :param attrs (list): optional - attrs to add to the row of each event, aligned with events.
+        :param data (list): optional - data for each event, aligned with events.
+        :returns (list): EventData for each event
+        """
+        attrs = [None] * len(events) if attrs is None else attrs
+        data = [None] * len(events) if data is None else data
+        assert len(attrs) == len(events), 'attrs must be the same length as events.'
+        assert len(data) == len(events), 'data must be the same length as events.'
+        
+        table = cls()
+        logged, rows = [], []
+        # events in a batch are offset by 1 microsecond from one timestamp so their timestamps and event_ids are unique
+        now = current_timestamp('US/Central')
+        for i, (name, event_attrs, event_data) in enumerate(zip(events, attrs, data)):
+            assert name in cls.events, f'event not found. events: {cls.events}'
+            timestamp = timestamp_str(now + timedelta(microseconds=i))
+            event_id = cls.hash1({'event': name, 'timestamp': timestamp})
+            event = EventData(id=event_id, name=name, timestamp=timestamp)
+            row = {'event_id': event.id, 'event': event.name, 'timestamp': event.timestamp}
+            row.update({} if event_attrs is None else event_attrs)
+            row['data'] = table.prepare_data(event=event, data=event_data)
+            logged.append(event)
+            rows.append(row)
+        
+        cls.insert(rows, constant_attrs={} if cls.constant_attrs is None else cls.constant_attrs, insert_to_master=True, ignore_extra_fields=True, skip_hashing=True)
+        for event, row in zip(logged, rows):
+            cls.master.Log('info',  f'Event "{event.name}" with event_id {event.id} occured at {event.timestamp}')
+            cls.master.Log('debug', f'Event "{event.name}" with event_id {event.id} occured at {event.timestamp} with insert {row}')
+            table.on_event(event=event)
+        return logged
 
     @classmethod
     def on_event(cls, event):
@@ -220,7 +273,7 @@ class EventHandlerLookup(Base, djpb.BaseMaster, djpu.UserTable, dj.Lookup):
 
     hash_name = 'event_handler_id'
 
-    @classproperty
+    @cached_classproperty
     def default_primary_attrs(cls):
         return f"""
         {cls.hash_name} : {event_handler_id_sqltype} # id of event handler
@@ -230,7 +283,7 @@ class EventHandlerLookup(Base, djpb.BaseMaster, djpu.UserTable, dj.Lookup):
     def extra_primary_attrs(cls):
         return """"""
 
-    @classproperty
+    @cached_classproperty
     def default_secondary_attrs(cls):
         return f"""
         timestamp=CURRENT_TIMESTAMP : timestamp
@@ -249,7 +302,7 @@ class EventHandler(Base, djpb.BasePart, djpu.UserTable, dj.Part, dj.Lookup):
     hash_name = 'event_handler_id'
     hashed_attrs = 'event', 'version'
 
-    @classproperty
+    @cached_classproperty
     def default_primary_attrs(cls):
         return f"""
         -> master
@@ -260,7 +313,7 @@ class EventHandler(Base, djpb.BasePart, djpu.UserTable, dj.Part, dj.Lookup):
     def extra_primary_attrs(cls):
         return """"""
 
-    @classproperty
+    @cached_classproperty
     def default_secondary_attrs(cls):
         return f""""""
 
@@ -276,15 +329,15 @@ class Maker(Base, djpb.BasePart, djpu.UserTable, dj.Part, dj.Computed):
     enable_hashing = True
     force = False
 
-    @classproperty
+    @cached_classproperty
     def hash_name(cls):
         return cls.hash_name
     
-    @classproperty
+    @cached_classproperty
     def hashed_attrs(cls):
         return cls.upstream.primary_key + cls.method.primary_key
     
-    @classproperty
+    @cached_classproperty
     def default_primary_attrs(cls):
         return f"""
         -> master
@@ -296,7 +349,7 @@ class Maker(Base, djpb.BasePart, djpu.UserTable, dj.Part, dj.Computed):
     def extra_primary_attrs(cls):
         return """"""
     
-    @classproperty
+    @cached_classproperty
     def default_secondary_attrs(cls):
         return f""""""
 
@@ -1,35 +1,81 @@
-from datetime import datetime
-import pytz
+from datetime import datetime, timedelta
+from functools import lru_cache
+from zoneinfo import ZoneInfo
+
+
+@lru_cache(maxsize=32)
+def get_timezone(name):
+    """
+    Returns the timezone for an IANA timezone name, e.g. "UTC" or "US/Central". Cached per name.
+
+    :param name: (str) timezone name
+    :returns: (zoneinfo.ZoneInfo) timezone
+    """
+    return ZoneInfo(name)
+
+
+def _localize(timestamp, tz):
+    """
+    Attaches tz to a naive timestamp, matching pytz localize(is_dst=False): 
+        ambiguous and nonexistent wall times resolve to the standard time interpretation.
+    """
+    t0, t1 = timestamp.replace(tzinfo=tz, fold=0), timestamp.replace(tzinfo=tz, fold=1)
+    if t0.utcoffset() != t1.utcoffset() and t1.dst() == timedelta(0):
+        return t1
+    return t0
+
 
 def timezone_converter(timestamp, source_tz, destination_tz, fmt=None):
     """
-    Converts timestamp from a source timezone to a destination timezone. 
-    To see commonly used timezone options run: 
-    
-    ```from pytz import common_timezones```
-    
-    :param timestamp: (datetime.datetime) timestamp to convert
-    :param source_tz: (pytz.timezone) source timezone to convert 
-    :param destination_tz: (pytz.timezone) destination timezone
+    Converts timestamp from a source timezone to a destination timezone.
+    To see available timezone options run:
+
+    ```from zoneinfo import available_timezones```
+
+    :param timestamp: (datetime.datetime) timestamp to convert. 
+        Ambiguous or nonexistent times in source_tz (around DST transitions) are interpreted as standard time.
+    :param source_tz: (str) source timezone to convert
+    :param destination_tz: (str) destination timezone
     :param fmt: (str) optional - timestamp format to pass to strftime
-    
+
     :returns: (datetime.datetime) converted timestamp
     """
-    dest_obj = pytz.timezone(destination_tz)
-    source_obj = pytz.timezone(source_tz).localize(timestamp.replace(tzinfo=None))
-    converted = dest_obj.normalize(source_obj.astimezone(dest_obj))
+    converted = _localize(timestamp, get_timezone(source_tz)).astimezone(get_timezone(destination_tz))
     return converted if fmt is None else converted.strftime(fmt)
 
 
 def current_timestamp(tz='UTC', fmt=None):
     """
-    Returns current timestamp in desired timezone (per pytz nomenclature)
+    Returns current timestamp in desired timezone (per IANA nomenclature)
 
-    ```from pytz import common_timezones```
+    ```from zoneinfo import available_timezones```
 
-    :param tz: (pytz.timezone) desired timezone
+    :param tz: (str) desired timezone
     :param fmt: (str) optional - timestamp format to pass to strftime
     :returns: (datetime.datetime) timestamp
     """
-    return timezone_converter(datetime.utcnow(), 'UTC', tz, fmt=fmt)
+    now = datetime.now(get_timezone(tz))
+    return now if fmt is None else now.strftime(fmt)
+
+
+def current_timestamp_str(tz='UTC'):
+    """
+    Returns current timestamp in desired timezone as a string with format "%Y-%m-%d_%H:%M:%S.%f".
+
+    Equivalent to current_timestamp(tz, fmt="%Y-%m-%d_%H:%M:%S.%f") but avoids strftime.
 
+    :param tz: (str) desired timezone
+    :returns: (str) timestamp
+    """
+    return timestamp_str(datetime.now(get_timezone(tz)))
+
+
+def timestamp_str(timestamp):
+    """
+    Formats timestamp as a string with format "%Y-%m-%d_%H:%M:%S.%f" without strftime.
+
+    :param timestamp: (datetime.datetime) timestamp to format
+    :returns: (str) timestamp
+    """
+    t = timestamp
+    return f"{t.year:04d}-{t.month:02d}-{t.day:02d}_{t.hour:02d}:{t.minute:02d}:{t.second:02d}.{t.microsecond:06d}"
@@ -5,20 +5,68 @@ import os
 from pathlib import Path
 import datetime
 import logging
-from .datetime_utils import timezone_converter
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from .datetime_utils import get_timezone
 
-def find_all_matching_files(name, path):
+def _scan_dir(path, name):
+    """
+    Lists a single directory.
+
+    :returns (tuple): paths to files matching name, paths to subdirectories (symlinks excluded). Both empty if path can't be read.
+    """
+    matches, subdirs = [], []
+    try:
+        with os.scandir(path) as entries:
+            for entry in entries:
+                try:
+                    is_dir = entry.is_dir()
+                except OSError:
+                    is_dir = False
+                if is_dir:
+                    if not entry.is_symlink():
+                        subdirs.append(entry.path)
+                elif entry.name == name:
+                    matches.append(Path(entry.path))
+    except OSError:
+        pass
+    return matches, subdirs
+
+
+def _find_all_matching_files(name, path):
+    result = []
+    stack = [path]
+    while stack:
+        matches, subdirs = _scan_dir(stack.pop(), name)
+        result.extend(matches)
+        # reversed so that directories are visited in the same order as os.walk
+        stack.extend(reversed(subdirs))
+    return result
+
+
+def find_all_matching_files(name, path, max_workers=1):
     """
     Finds all files matching filename within path.
 
     :param name (str): file name to search
     :param path (str): path to search within
+    :param max_workers (int): number of threads used to search the top-level subdirectories of path. 
+        Values > 1 help on network filesystems where directory listing latency dominates. Default 1 searches serially.
     :returns (list): returns list of matching paths to filenames or empty list if no matches found. 
     """
-    result = []
-    for root, _, files in os.walk(path):
-        if name in files:
-            result.append(Path(os.path.join(root, name)))
+    path = os.fspath(path)
+    if max_workers is None or max_workers <= 1:
+        return _find_all_matching_files(name, path)
+
+    result, subdirs = _scan_dir(path, name)
+    if len(subdirs) < 2:
+        for subdir in subdirs:
+            result.extend(_find_all_matching_files(name, subdir))
+        return result
+
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(subdirs))) as executor:
+        for matches in executor.map(partial(_find_all_matching_files, name), subdirs):
+            result.extend(matches)
     return result
 
 
@@ -33,13 +81,35 @@ def get_file_modification_time(filepath, timezone, fmt=None):
     Gets modification time of file.
     
     :param filepath: (patlib.Path or str) path to file
-    :timezone: (str) desired timezone in pytz format (e.g. 'US/Central')
+    :timezone: (str) desired timezone in IANA format (e.g. 'US/Central')
     :fmt: optional (str) timestamp format to pass to strftime 
     
     :returns: datetime object
     """
-    ts = datetime.datetime.fromtimestamp(Path(filepath).stat().st_mtime, tz=datetime.timezone.utc)
-    return timezone_converter(ts, 'UTC', timezone, fmt=fmt)
+    ts = datetime.datetime.fromtimestamp(os.stat(filepath).st_mtime, tz=get_timezone(timezone))
+    return ts if fmt is None else ts.strftime(fmt)
+
+
+def get_file_modification_times(directory, timezone, fmt=None):
+    """
+    Gets modification times of all files in a directory (not recursive).
+
+    Uses os.scandir, which avoids a separate stat per file where the platform returns it with the listing.
+    
+    :param directory: (patlib.Path or str) path to directory
+    :timezone: (str) desired timezone in IANA format (e.g. 'US/Central')
+    :fmt: optional (str) timestamp format to pass to strftime 
+    
+    :returns: (dict) mapping file name to datetime object (or str if fmt is provided)
+    """
+    tz = get_timezone(timezone)
+    result = {}
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            if entry.is_file():
+                ts = datetime.datetime.fromtimestamp(entry.stat().st_mtime, tz=tz)
+                result[entry.name] = ts if fmt is None else ts.strftime(fmt)
+    return result
 
 
 def append_timestamp_to_filepath(filepath, timestamp, separator='__', with_suffix=None, verbose=True, return_filepath=False):
@@ -53,10 +123,11 @@ def append_timestamp_to_filepath(filepath, timestamp, separator='__', with_suffi
     :param verbose: (bool) logs renamed filepath
     :param return_filepath: (bool) returns renamed filepath patlib.Path
     """
-    filepath = Path(filepath)  
-    filepath_rn = filepath.with_name(f'{filepath.stem}{separator}{timestamp}').with_suffix(filepath.suffix if with_suffix is None else with_suffix)
-    filepath.rename(filepath_rn)
+    filepath = os.fspath(filepath)
+    base, suffix = os.path.splitext(filepath)
+    filepath_rn = f'{base}{separator}{timestamp}{suffix if with_suffix is None else with_suffix}'
+    os.rename(filepath, filepath_rn)
     if verbose:
         logging.info(f'File renamed: {filepath_rn}')
     if return_filepath:
-        return filepath_rn
\ No newline at end of file
+        return Path(filepath_rn)
\ No newline at end of file
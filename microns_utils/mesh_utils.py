@@ -5,27 +5,61 @@ import numpy as np
 def index_unique_rows(full_coordinate_array):
     """
     Separates an array of nested coordinate rows into an array of unique rows and and index array.
+
+    Unique rows are returned in lexicographic order, as with np.unique(axis=0).
+
+    Non-NumPy arrays that implement the NumPy API (e.g. CuPy) are dispatched to their own unique(axis=0).
+    """
+    if not isinstance(full_coordinate_array, np.ndarray):
+        vertices, flat_idx = np.unique(full_coordinate_array.reshape(-1, full_coordinate_array.shape[-1]), axis=0, return_inverse=True)
+        return vertices, flat_idx.reshape(-1, full_coordinate_array.shape[-2])
+    rows = np.ascontiguousarray(full_coordinate_array.reshape(-1, full_coordinate_array.shape[-1]))
+    if rows.dtype.kind == 'f':
+        rows = rows + 0. # so that -0. and 0. compare equal as bytes
+    # view each row as a single opaque scalar so unique compares one key per row instead of sorting by columns
+    keys = rows.view(np.dtype((np.void, rows.dtype.itemsize * rows.shape[1]))).ravel()
+    _, first_idx, flat_idx = np.unique(keys, return_index=True, return_inverse=True)
+    # keys sort in byte order, so the unique rows are reordered lexicographically and the inverse remapped
+    unique_rows = rows[first_idx]
+    order = np.lexsort(unique_rows.T[::-1])
+    rank = np.empty_like(order)
+    rank[order] = np.arange(len(order))
+    return unique_rows[order], rank[flat_idx.ravel()].reshape(-1, full_coordinate_array.shape[-2])
+
+def get_midpoints(edges, out=None):
     """
-    vertices, flat_idx = np.unique(full_coordinate_array.reshape(-1, full_coordinate_array.shape[-1]), axis=0, return_inverse=True)
-    return vertices, flat_idx.reshape(-1, full_coordinate_array.shape[-2])
+    Returns the midpoints of an array of edges (N x 2 x F).
 
-def get_midpoints(edges):
-    return (edges[:, 0] + edges[:, 1]) / 2
+    :param out: optional array (N x F) to write the midpoints into, e.g. a reused scratch buffer.
+    """
+    a, b = edges[:, 0], edges[:, 1]
+    if out is None:
+        out = np.empty(a.shape, dtype=np.result_type(a.dtype, 0.5))
+    np.add(a, b, out=out)
+    out *= 0.5
+    return out
 
 def get_thresholded_bbox(vertices, threshold):
-     return np.array((vertices.min(0), vertices.max(0))) + np.array((-threshold, threshold))[:, None] 
+    bbox = np.empty((2, vertices.shape[1]), dtype=np.result_type(vertices.dtype, np.asarray(threshold)))
+    np.subtract(vertices.min(0), threshold, out=bbox[0], dtype=bbox.dtype)
+    np.add(vertices.max(0), threshold, out=bbox[1], dtype=bbox.dtype)
+    return bbox
 
 def bbox_point_containment(points, bbox):
     """
     Returns a mask of which points are within the boundary described by the bbox at all.
+
+    Also accepts arrays that implement the NumPy API (e.g. CuPy), in which case the mask is computed on their device.
     """
-    return np.logical_and.reduce((
-        points[..., 0] >= bbox[0, 0],
-        points[..., 0] <= bbox[1, 0],
-        points[..., 1] >= bbox[0, 1],
-        points[..., 1] <= bbox[1, 1],
-        points[..., 2] >= bbox[0, 2],
-        points[..., 2] <= bbox[1, 2],
-    ), axis=0)
+    if isinstance(bbox, (list, tuple)):
+        bbox = np.asarray(bbox)
+    # compare one axis at a time into two reused buffers instead of allocating Nx3 temporaries
+    mask = np.greater_equal(points[..., 0], bbox[0, 0])
+    tmp = np.empty_like(mask)
+    mask &= np.less_equal(points[..., 0], bbox[1, 0], out=tmp)
+    for i in (1, 2):
+        mask &= np.greater_equal(points[..., i], bbox[0, i], out=tmp)
+        mask &= np.less_equal(points[..., i], bbox[1, i], out=tmp)
+    return mask
 
 
@@ -1,6 +1,8 @@
 """
 Misc utils
 """
+from functools import lru_cache
+
 
 class classproperty:
     def __init__(self, f):
@@ -10,6 +12,24 @@ class classproperty:
         return self.f(owner)
 
 
+class cached_classproperty(classproperty):
+    """
+    classproperty that computes its value once per class and caches it.
+
+    Values are cached separately for each subclass, so subclasses that override the attributes a value depends on get their own result.
+    """
+    def __init__(self, f):
+        super().__init__(f)
+        self.cache = {}
+
+    def __get__(self, obj, owner):
+        try:
+            return self.cache[owner]
+        except KeyError:
+            value = self.cache[owner] = self.f(owner)
+            return value
+
+
 def wrap(item, return_as_list=False):
     if isinstance(item, (list, tuple)):
         return item
@@ -33,6 +53,7 @@ def unwrap(item, enforce_one_item=False):
         return item
     
 
+@lru_cache(maxsize=4096)
 def sc_to_ucc(string):
     """
     formats snake_case str as UpperCamelCase
@@ -40,6 +61,15 @@ def sc_to_ucc(string):
     return ''.join(string.title().split('_'))
 
 
+_field_dict_containers = (dict, list, set, tuple)
+_missing = object()
+
+
+@lru_cache(maxsize=1024)
+def _split_path(path):
+    return tuple(path.split('.'))
+
+
 class FieldDict(dict):
     """
     FieldDict is an enhanced dictionary that allows attribute-style access 
@@ -75,7 +105,7 @@ class FieldDict(dict):
         
         super().__init__()
         for key, value in kwargs.items():
-            self[key] = self._convert(value)
+            self[key] = value
     
     _defaults = {'_name': "FieldDict", '_key_disp_limit': 4}
 
@@ -93,7 +123,7 @@ class FieldDict(dict):
             # Handle setting of private and protected attributes normally
             super(FieldDict, self).__setattr__(name, value)
         else:
-            self[name] = self._convert(value)
+            self[name] = value
 
     def __delattr__(self, name):
         if name.startswith('_'):
@@ -149,12 +179,12 @@ class FieldDict(dict):
         Returns:
             The value found at the path, or the default value if the path is not found.
         """
-        keys = path.split('.')
         current = self
-        for key in keys:
-            if key in current:
-                current = current[key]
-            else:
+        for key in _split_path(path):
+            if not isinstance(current, dict):
+                return default
+            current = current.get(key, _missing)
+            if current is _missing:
                 return default
         return current
 
@@ -162,8 +192,13 @@ class FieldDict(dict):
 
     @staticmethod
     def _convert(value):
+        if type(value) is FieldDict:
+            return value
         if isinstance(value, dict) and not isinstance(value, FieldDict):
             return FieldDict(**value)
         elif isinstance(value, (list, set, tuple)):
+            # containers without nested containers have nothing to convert, but mutable ones are still copied
+            if not any(isinstance(v, _field_dict_containers) for v in value):
+                return value if isinstance(value, tuple) else type(value)(value)
             return type(value)(FieldDict._convert(v) for v in value)
         return value
\ No newline at end of file
@@ -2,12 +2,74 @@
 Utilities for modeling.
 """
 import numpy as np
-from functools import reduce
 import re
-from scipy.interpolate import griddata, RBFInterpolator
+
+_monomial_re = re.compile(r'^[a-z](?:\^\d+)?(?:\*[a-z](?:\^\d+)?)*$')
+_monomial_factor_re = re.compile(r'([a-z])(?:\^(\d+))?')
+
+
+def _regular_grid(points, values):
+    """
+    Checks if points (N x F) are the full Cartesian product of their unique coordinates along each feature.
+
+    :returns: (axes, gridded values) if points form a regular grid, else None. 
+        axes is a list of the sorted unique coordinates of each feature, gridded values has shape (len(axes[0]), ..., len(axes[-1]), T).
+    """
+    points = np.asarray(points)
+    values = np.asarray(values)
+    if points.ndim != 2:
+        return None
+    axes, grid_idx = [], []
+    for col in points.T:
+        axis, idx = np.unique(col, return_inverse=True)
+        axes.append(axis)
+        grid_idx.append(idx.ravel())
+    shape = tuple(len(axis) for axis in axes)
+    if np.prod(shape) != len(points):
+        return None
+    flat_idx = np.ravel_multi_index(grid_idx, shape)
+    if not (np.bincount(flat_idx, minlength=len(points)) == 1).all():
+        return None
+    grid_values = np.empty((len(points),) + values.shape[1:], dtype=values.dtype)
+    grid_values[flat_idx] = values
+    return axes, grid_values.reshape(shape + values.shape[1:])
+
+
+def _build_phi(variables, monomials):
+    """
+    Generates a function that computes the N x K feature matrix (bias included) of monomial terms, with one line of code per term.
+
+    Each power of each variable is computed once, by successive multiplication, and shared between terms.
+
+    :param variables: (list) variable names, in the order of the feature columns
+    :param monomials: (list) parsed terms, see PolyModel._parse_monomials
+    :returns: function that takes data (N x F array) and returns the feature matrix
+    """
+    def power_name(var, exp):
+        return var if exp == 1 else f'{var}_{exp}'
+
+    lines = [f'{var} = data[:, {jj}]' for jj, var in enumerate(variables)]
+    computed = {(var, 1) for var in variables}
+    terms = []
+    for ii, monomial in enumerate(monomials, 1):
+        for var, exp in monomial:
+            if exp == 0 and (var, 0) not in computed:
+                lines.append(f'{var}_0 = {var} ** 0')
+                computed.add((var, 0))
+            for kk in range(2, exp + 1):
+                if (var, kk) not in computed:
+                    lines.append(f'{power_name(var, kk)} = {power_name(var, kk - 1)} * {var}')
+                    computed.add((var, kk))
+        terms.append(f'out[:, {ii}] = ' + ' * '.join(power_name(var, exp) for var, exp in monomial))
+    lines += [f'out = np.empty((len(data), {len(monomials) + 1}), like=data)', 'out[:, 0] = 1'] + terms + ['return out']
+    source = 'def _phi(data):\n' + '\n'.join('    ' + line for line in lines)
+    namespace = {'np': np}
+    exec(compile(source, '<PolyModel>', 'exec'), namespace)
+    return namespace['_phi']
+
 
 class InterpModel:
-    def __init__(self, points, values, method, method_kws=None):
+    def __init__(self, points, values, method, method_kws=None, neighbors='auto'):
         """
         Initialize with parameters for supported interpolation methods.
 
@@ -17,17 +79,29 @@ class InterpModel:
             Options: 
                 - "griddata" - scipy.interpolate.griddata
                 - 'rbf' - scipy.interpolate.RBFInterpolator
+                - 'regular_grid' - scipy.interpolate.RegularGridInterpolator. Requires points to form a regular grid (in any order).
+                    Much faster than "griddata" or "rbf" for gridded data.
         :param method_kws: (dict) keywords to pass to interpolation function
+        :param neighbors: (int, None or "auto") method = "rbf" only. Number of nearest data points used to interpolate each point.
+            Local interpolation scales to many more data points than a global solve.
+            "auto" (default) uses min(150, N). None uses all N points. Ignored if "neighbors" is provided in method_kws. 
 
-        To use, pass points to interpolate to run() after initialization
+        To use, pass points to interpolate to run() after initialization. 
+        The interpolator is built on the first call to run() and reused by later calls.
         """
-        valid_methods = ['griddata', 'rbf']
+        valid_methods = ['griddata', 'rbf', 'regular_grid']
         assert method in valid_methods, f'Method provided not recognized. Valid methods: {valid_methods}'
 
         self._points = points
         self._values = values
         self._method = method
         self.method_kws = method_kws if method_kws is not None else {}
+        if method == 'rbf' and 'neighbors' not in self.method_kws:
+            self.method_kws = {**self.method_kws, 'neighbors': min(150, len(points)) if neighbors == 'auto' else neighbors}
+        self._interpolator = None
+        if method == 'regular_grid':
+            self._grid = _regular_grid(points, values)
+            assert self._grid is not None, 'points must form a regular grid for method "regular_grid".'
     
     @property
     def points(self):
@@ -41,23 +115,68 @@ class InterpModel:
     def method(self):
         return self._method
 
-    def run(self, xi):
+    def _get_interpolator(self):
+        """
+        Returns the interpolator for points and values, constructing it on first call. 
+
+        For method = "griddata", returns the interpolator griddata would construct internally, or None for 1-D points, 
+            which griddata handles with interp1d.
+        """
+        if self._interpolator is None:
+            if self.method == 'griddata':
+                points = self.points
+                if isinstance(points, tuple):
+                    # griddata also accepts points as a tuple of D 1-D arrays of coordinates
+                    points = np.column_stack(points) if len(points) > 1 else points[0]
+                points = np.asarray(points)
+                if points.ndim < 2 or points.shape[-1] == 1:
+                    return None
+                from scipy.interpolate import LinearNDInterpolator, NearestNDInterpolator, CloughTocher2DInterpolator
+                kws = dict(self.method_kws)
+                interp_method = kws.pop('method', 'linear')
+                if interp_method == 'nearest':
+                    kws.pop('fill_value', None)
+                    self._interpolator = NearestNDInterpolator(points, self.values, **kws)
+                elif interp_method == 'linear':
+                    self._interpolator = LinearNDInterpolator(points, self.values, **kws)
+                elif interp_method == 'cubic':
+                    self._interpolator = CloughTocher2DInterpolator(points, self.values, **kws)
+                else:
+                    raise ValueError(f'Unknown griddata interpolation method {interp_method}')
+            
+            elif self.method == 'rbf':
+                from scipy.interpolate import RBFInterpolator
+                self._interpolator = RBFInterpolator(self.points, self.values, **self.method_kws)
+            
+            elif self.method == 'regular_grid':
+                from scipy.interpolate import RegularGridInterpolator
+                self._interpolator = RegularGridInterpolator(*self._grid, **self.method_kws)
+            
+            else:
+                raise AttributeError(f'method {self.method} not recognized.')
+        return self._interpolator
+
+    def run(self, xi, chunk_size=100_000):
         """
         :param xi: Points at which to interpolate data
+        :param chunk_size: (int) method = "rbf" only. Maximum number of points evaluated at once, which bounds the size 
+            of the kernel matrices built during evaluation. None evaluates all points at once.
         
         :returns: array of interpolated values.
         """
-        if self.method == 'griddata':
+        interpolator = self._get_interpolator()
+        if interpolator is None:
+            from scipy.interpolate import griddata
             return griddata(self.points, self.values, xi, **self.method_kws)
-        
-        if self.method == 'rbf':
-            return RBFInterpolator(self.points, self.values, **self.method_kws)(xi)
-        
-        raise AttributeError(f'method {self.method} not recognized.')
+        if self.method == 'rbf' and chunk_size is not None:
+            xi = np.asarray(xi)
+            if len(xi) > chunk_size:
+                return np.concatenate([interpolator(xi[i:i + chunk_size]) for i in range(0, len(xi), chunk_size)])
+        return interpolator(xi)
     
     
 class PolyModel:
-    def __init__(self, model, features=None, targets=None, constants=None):
+    def __init__(self, model, features=None, targets=None, constants=None, solver='lstsq'):
         """
         Solve for the constants of a polynomial model given a set of features and targets.
         
@@ -66,11 +185,16 @@ class PolyModel:
         Initialize a solved model with constants.
         
         :param model: (str) the polynomial model to fit with F numbers of variables. A bias term is automatically included.
-            The model is fit using least squares with the formula: inv(X.T @ X) @ (X.T @ Y)
+            The model is fit using least squares, see solver.
             
         :param features: (N x F array) N is the number of samples and F is the number of features. Required unless constants is provided. 
         :param targets: (N x T array) N is the number of samples and T is the number of targets. Required unless constants is provided. 
         :params constants: (F x T array) Constants of a solved model. Required unless features and targets are provided.
+        :param solver: (str) least squares solver used to fit the model.
+            Options:
+                - "lstsq" - (default) np.linalg.lstsq, factorizes the feature matrix directly (SVD). Most stable.
+                - "cholesky" - solves the normal equations with a Cholesky factorization. Faster for very tall feature matrices, 
+                    but squares the condition number and requires the features to be linearly independent.
         
 
         Examples: 
@@ -178,6 +302,7 @@ class PolyModel:
         self.model = model
         self._terms = ['_bias'] + [t.strip() for t in model.split('+')]
         self.variables = np.unique(re.findall('[a-z]', model)).tolist()
+        self._compile()
         
         if solve:
             assert features is not None and targets is not None, "Provide features and targets."
@@ -185,25 +310,13 @@ class PolyModel:
             assert np.ndim(targets) == 2, 'targets must be 2 dimensional'
             self.features = features
             self.targets = targets
-            self._features_with_bias = np.hstack([np.expand_dims(np.ones(len(self.features)), 1), self.features])
 
             assert len(self.features.T) == len(self.variables), \
                 f'The feature dimension must match the number of model variables. features.shape[1] = {self.features.shape[1]}, but the model has {len(self.variables)} variables.'
 
-            for ll, ff in zip(['_bias'] + self.variables, self._features_with_bias.T):
-                setattr(self, ll, np.expand_dims(ff, 1))
-
-            mod_terms = self._terms.copy()
-            for ii, tt in enumerate(self._terms):
-                mod_terms[ii] = reduce(lambda mm, nn: mm.replace(nn, f'{nn}').replace('^', '**').strip(), ['_bias'] + self.variables, tt)
-
             # solve
-            fc = []
-            for tt in mod_terms:
-                fc.append(eval(tt, self.__dict__.copy()))
-            self._features_computed = np.hstack(fc)
-
-            self.constants = self.least_squares(self._features_computed, self.targets)
+            self._features_computed = self._compute_features(np.asarray(self.features))
+            self.constants = self.least_squares(self._features_computed, self.targets, solver=solver)
         
         if initialize:
             constants = np.array(constants)
@@ -214,36 +327,83 @@ class PolyModel:
     @property
     def r2(self):
         try:
-            return 1 - (np.sum((self.run(self.features) - self.targets)**2, 0) / np.sum((self.targets - self.targets.mean(0))**2, 0))
+            # reuses the feature matrix the model was solved with instead of rebuilding it with run()
+            resid = self._features_computed @ self.constants - self.targets
+            return 1 - (np.sum(resid * resid, 0) / np.sum((self.targets - self.targets.mean(0))**2, 0))
         except Exception as e:
             print('r2 failed to compute. r2 cant be solved without features and targets.')
             raise e
             
+    def _compile(self):
+        """
+        Compiles the model terms. If every term is a monomial, also generates _phi, which computes the feature matrix with straight-line code.
+        """
+        self._compiled_terms = [compile(t.replace('^', '**'), '<PolyModel>', 'eval') for t in self._terms]
+        self._monomials = self._parse_monomials(self._terms[1:])
+        self._phi = _build_phi(self.variables, self._monomials) if self._monomials is not None else None
+
+    def __getstate__(self):
+        # compiled code and generated functions can't be pickled, they are rebuilt from the model on unpickling
+        state = self.__dict__.copy()
+        del state['_compiled_terms'], state['_phi']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._compile()
+
+    @staticmethod
+    def _parse_monomials(terms):
+        """
+        Parses terms of the form "x", "x^2" or "x*y^3" into lists of (variable, exponent) pairs.
+
+        :returns: list of parsed terms, or None if any term is not a monomial.
+        """
+        monomials = []
+        for term in terms:
+            term = term.replace(' ', '')
+            if not _monomial_re.match(term):
+                return None
+            monomials.append([(var, int(exp) if exp else 1) for var, exp in _monomial_factor_re.findall(term)])
+        return monomials
+
+    def _compute_features(self, data):
+        """
+        Computes the N x K feature matrix of the model terms (bias included) for data.
+        """
+        if self._phi is not None:
+            return self._phi(data)
+        columns = dict(zip(self.variables, data.T))
+        features = np.empty((len(data), len(self._terms)), like=data)
+        features[:, 0] = 1
+        # one namespace is shared by all terms, without builtins
+        namespace = {'__builtins__': {}}
+        for ii, code in enumerate(self._compiled_terms[1:], 1):
+            features[:, ii] = eval(code, namespace, columns)
+        return features
+
     @staticmethod
-    def least_squares(p, q):
-        return np.linalg.inv(p.T @ p) @ (p.T @ q)
+    def least_squares(p, q, solver='lstsq'):
+        if solver == 'lstsq':
+            return np.linalg.lstsq(p, q, rcond=None)[0]
+        if solver == 'cholesky':
+            from scipy.linalg import solve
+            return solve(p.T @ p, p.T @ q, assume_a='pos', overwrite_a=True, overwrite_b=True)
+        raise AttributeError(f'solver {solver} not recognized. Options are ["lstsq", "cholesky"]')
     
     def run(self, data):
         """
         Run model with data.
         
         :param data: (N x F array)  N is the number of samples and F is the number of features  
+            Arrays that implement the NumPy API (e.g. CuPy) are run on their own device and returned as the same array type.
         
         :returns: model output
         """
-        data = np.array(data)
+        if isinstance(data, np.ndarray) or not hasattr(data, '__array_function__'):
+            # ndarray subclasses (e.g. np.matrix) are converted, as their indexing and operators differ from ndarray
+            data = np.asarray(data)
         assert len(data.T) == len(self.variables), \
             f'The feature dimension must match the number of model variables. data.shape[1] = {data.shape[1]}, but the model has {len(self.variables)} variables.'
         
-        mapping = {}
-        for var, col in zip(self.variables, data.T):
-            mapping[var] = col
-
-        features = [np.expand_dims(np.ones(len(data)), 1)]
-        for t in self._terms[1:]:
-            features.append(np.expand_dims(eval(t.replace('^', '**'), mapping), 1))
-        
-        out = []
-        for const in self.constants.T:
-            out.append(np.sum(const * np.hstack(features), 1))
-        return np.stack(out).T
\ No newline at end of file
+        return self._compute_features(data) @ np.asarray(self.constants, like=data)
\ No newline at end of file
@@ -6,12 +6,13 @@ NeuroglancerAnnotationUI (https://github.com/seung-lab/NeuroglancerAnnotationUI)
 
 import random
 import string
+import threading
 import numpy as np
 import nglui
 from nglui import EasyViewer
 import pandas as pd
 from .ap_utils import set_CAVEclient
-from .misc_utils import wrap, classproperty
+from .misc_utils import wrap, classproperty, cached_classproperty
 from nglui import statebuilder
 
 default_ng_res = (4,4,40)
@@ -19,22 +20,25 @@ default_ng_res = (4,4,40)
 
 class NgLinks:
     _client = None
+    _lock = threading.Lock()
 
     @classproperty
     def client(cls):
         if cls._client is None:
-            cls._client = set_CAVEclient('minnie65_phase3_v1')
+            with cls._lock:
+                if cls._client is None:
+                    cls._client = set_CAVEclient('minnie65_phase3_v1', use_cache=False)
         return cls._client
     
-    @classproperty
+    @cached_classproperty
     def em_src(cls):
         return cls.client.info.image_source()
 
-    @classproperty
+    @cached_classproperty
     def seg_src(cls):
         return cls.client.info.segmentation_source()
     
-    @classproperty
+    @cached_classproperty
     def nuc_src(cls):
         return cls.client.materialize.get_table_metadata('nucleus_detection_v0')['flat_segmentation_source']
     
@@ -100,10 +104,10 @@ def view_arrays_in_neuroglancer(arrays:list, names:list=None, colors:list=None,
         names = [f'layer_{i+1}' for i in range(len(arrays))]
     
     if colors is None:
-        colors = ["#{:06x}".format(np.random.randint(0, 0xFFFFFF)) for _ in range(len(arrays))]
+        colors = [f"#{v:06x}" for v in np.random.randint(0, 0x1000000, size=len(arrays))]
 
     for name, array, color in zip(names, arrays, colors):
-        dfs.append(pd.DataFrame([[[e[0],e[1],e[2]]] for e in array/res]).rename(columns={0: name}))
+        dfs.append(pd.DataFrame({name: (np.asarray(array, dtype=float) / np.asarray(res)).tolist()}))
         annotation_layer = nglui.statebuilder.AnnotationLayerConfig(name=name, mapping_rules=nglui.statebuilder.PointMapper(name), color=color)
         sbs.append(nglui.statebuilder.StateBuilder([annotation_layer], view_kws=default_view_kws if view_kws is None else view_kws))
     cb = nglui.statebuilder.ChainedStateBuilder(sbs)
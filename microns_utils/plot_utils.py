@@ -26,7 +26,9 @@ def plot_cube_edges_3D(ax, origin, size=1, c='k', alpha=1):
     # List of sides' pairs of the cube
     edges = [[0, 1], [1, 2], [2, 3], [3, 0], [0, 4], [1, 5], [2, 6], [3, 7], [4, 5], [5, 6], [6, 7], [7, 4]]
     
-    # Plot the edges
-    for edge in edges:
-        line = np.array([vertices[edge[0]], vertices[edge[1]]])
-        ax.plot(line[:, 0], line[:, 1], line[:, 2], c=c, alpha=alpha)
\ No newline at end of file
+    # Plot the edges as a single collection instead of one artist per edge
+    from mpl_toolkits.mplot3d.art3d import Line3DCollection
+    had_data = ax.has_data()
+    ax.add_collection3d(Line3DCollection(vertices[np.array(edges)], colors=c, alpha=alpha))
+    # add_collection3d does not update the data limits the way ax.plot does
+    ax.auto_scale_xyz(vertices[:, 0], vertices[:, 1], vertices[:, 2], had_data=had_data)
\ No newline at end of file
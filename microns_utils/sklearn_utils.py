@@ -1,11 +1,9 @@
 import numpy as np
 import pandas as pd
 from scipy.stats import chi2, t
-from sklearn.metrics import log_loss
 from .transform_utils import rotate_points_3d
 from sklearn.base import BaseEstimator, TransformerMixin
 from sklearn.metrics import get_scorer, confusion_matrix, ConfusionMatrixDisplay
-from sklearn.model_selection import train_test_split
 from sklearn.model_selection import KFold
 from sklearn.linear_model import LogisticRegression, LogisticRegressionCV
 
@@ -23,6 +21,45 @@ class RotationTransformer(BaseEstimator, TransformerMixin):
         return rotate_points_3d(X, cols=self.cols, degrees=self.degrees, decimals=self.decimals)
 
 
+def _fast_confusion_matrix(y_true, y_pred, labels, normalize=None):
+    """
+    Computes the same confusion matrix as sklearn.metrics.confusion_matrix, with a single np.bincount.
+    Faster than sklearn for many labels.
+
+    :param y_true: (array) true labels
+    :param y_pred: (array) predicted labels
+    :param labels: (array) labels to index the matrix. Samples whose true or predicted label is not in labels are ignored.
+    :param normalize: (None, "true", "pred" or "all") see sklearn.metrics.confusion_matrix
+    :returns: (L x L array) confusion matrix
+    """
+    labels = np.asarray(labels)
+    n_labels = len(labels)
+    sorter = np.argsort(labels, kind='stable')
+    sorted_labels = labels[sorter]
+
+    def to_index(y):
+        pos = np.searchsorted(sorted_labels, y).clip(max=n_labels - 1)
+        return sorter[pos], sorted_labels[pos] == y
+
+    true_idx, true_valid = to_index(np.asarray(y_true))
+    pred_idx, pred_valid = to_index(np.asarray(y_pred))
+    valid = true_valid & pred_valid
+    cm = np.bincount(true_idx[valid] * n_labels + pred_idx[valid], minlength=n_labels * n_labels).reshape(n_labels, n_labels)
+
+    if normalize is None:
+        return cm
+    with np.errstate(all='ignore'):
+        if normalize == 'true':
+            cm = cm / cm.sum(axis=1, keepdims=True)
+        elif normalize == 'pred':
+            cm = cm / cm.sum(axis=0, keepdims=True)
+        elif normalize == 'all':
+            cm = cm / cm.sum()
+        else:
+            raise ValueError("normalize must be one of {'true', 'pred', 'all', None}")
+    return np.nan_to_num(cm)
+
+
 def plot_confusion_matrix(
     y_true, 
     y_pred, 
@@ -38,7 +75,10 @@ def plot_confusion_matrix(
     ylabel=None,
     cmap=None
 ):
-    cm = confusion_matrix(y_true, y_pred, labels=labels, normalize=normalize)
+    if labels is not None and len(labels) > 64:
+        cm = _fast_confusion_matrix(y_true, y_pred, labels=labels, normalize=normalize)
+    else:
+        cm = confusion_matrix(y_true, y_pred, labels=labels, normalize=normalize)
     
     disp = ConfusionMatrixDisplay(confusion_matrix=cm, display_labels=labels)
     disp.plot(include_values=False, cmap=cmap, ax=ax)
@@ -49,11 +89,10 @@ def plot_confusion_matrix(
         # Threshold for displaying values
         annotate_value_threshold = 0 if annotate_value_threshold is None else annotate_value_threshold
         
-        # Annotate values above the threshold
-        for i in range(cm.shape[0]):
-            for j in range(cm.shape[1]):
-                if cm[i, j] > annotate_value_threshold:
-                    ax.text(j, i, f'{cm[i, j]:.2f}', ha="center", va="center", color="white", fontsize=6)
+        # Annotate values above the threshold, only visiting those cells
+        ii, jj = np.where(cm > annotate_value_threshold)
+        for i, j, v in zip(ii.tolist(), jj.tolist(), cm[ii, jj].tolist()):
+            ax.text(j, i, f'{v:.2f}', ha="center", va="center", color="white", fontsize=6)
 
     if xlabel is not None:
         ax.set_xlabel(xlabel)
@@ -63,7 +102,16 @@ def plot_confusion_matrix(
         ax.set_xticklabels(ax.get_xticklabels(), rotation=45)
 
 
-def perform_k_fold_logistic_regression(X, y, n_splits=10, shuffle=True, random_state=None, lr_kws=None, use_CV=False):
+def _take_rows(a, idx):
+    """
+    Returns a[idx], as a view (slice) instead of a copy if idx is a contiguous ascending range, e.g. KFold test indices when shuffle=False.
+    """
+    if len(idx) > 0 and idx[-1] - idx[0] + 1 == len(idx) and (len(idx) == 1 or (np.diff(idx) == 1).all()):
+        return a[idx[0]:idx[-1] + 1]
+    return a[idx]
+
+
+def perform_k_fold_logistic_regression(X, y, n_splits=10, shuffle=True, random_state=None, lr_kws=None, use_CV=False, store_arrays=False):
     """
     Performs K-Fold cross-validation for logistic regression on a given dataset and returns
     comprehensive details about each fold in a dictionary.
@@ -77,14 +125,19 @@ def perform_k_fold_logistic_regression(X, y, n_splits=10, shuffle=True, random_s
                                      Use an integer for reproducible output across multiple function calls. Default is None.
         lr_kws (dict, optional): Additional keyword arguments to be passed to the LogisticRegression constructor.
                                  Examples include 'solver', 'max_iter', etc. Default is None.
+        store_arrays (bool, optional): If True, also stores the training and testing arrays of each fold in the results. 
+                                       Default is False, as they hold n_splits copies of the dataset. 
+                                       Use get_fold_arrays to get them from the indices instead.
     
     Returns:
         dict: A list of dictionaries for each fold, where each dictionary contains:
-            - 'X_train' (array-like): Training features for the fold.
-            - 'X_test' (array-like): Testing features for the fold.
-            - 'y_train' (array-like): Training target for the fold.
-            - 'y_test' (array-like): Testing target for the fold.
+            - 'train_idx' (array): Indices of the training samples for the fold.
+            - 'test_idx' (array): Indices of the testing samples for the fold.
+            - 'X_train', 'X_test', 'y_train', 'y_test' (array-like): Training and testing features and targets for the fold. 
+                Only if store_arrays is True.
+            - 'y_proba' (array-like): Predicted probabilities for the testing set of the fold.
             - 'y_pred' (array-like): Predicted target values for the testing set of the fold.
+            - 'coef' (array-like): Coefficients of the model for the fold.
             - 'model' (LogisticRegression): Trained LogisticRegression model for the fold.
     """
     lr_kws = {} if lr_kws is None else lr_kws
@@ -95,8 +148,8 @@ def perform_k_fold_logistic_regression(X, y, n_splits=10, shuffle=True, random_s
     fold_results = []
     fold_number = 0
     for train_idx, test_idx in kf.split(X):
-        X_train, X_test = X[train_idx], X[test_idx]
-        y_train, y_test = y[train_idx], y[test_idx]
+        X_train, X_test = _take_rows(X, train_idx), _take_rows(X, test_idx)
+        y_train, y_test = _take_rows(y, train_idx), _take_rows(y, test_idx)
         
         # Initialize the logistic regression model
         if not use_CV:
@@ -117,21 +170,59 @@ def perform_k_fold_logistic_regression(X, y, n_splits=10, shuffle=True, random_s
         coef = model.coef_
 
         # Save all relevant information for the fold
-        fold_results.append({
-            'X_train': X_train,
-            'X_test': X_test,
-            'y_train': y_train,
-            'y_test': y_test,
+        fold_result = {
+            'train_idx': train_idx,
+            'test_idx': test_idx,
             'y_proba': y_proba,
             'y_pred': y_pred,
             'coef': coef,
             'model': model
-        })
+        }
+        if store_arrays:
+            fold_result.update({
+                'X_train': X_train,
+                'X_test': X_test,
+                'y_train': y_train,
+                'y_test': y_test,
+            })
+        fold_results.append(fold_result)
         fold_number += 1
 
     return fold_results
 
 
+def get_fold_arrays(X, y, fold):
+    """
+    Returns the training and testing arrays of a fold from perform_k_fold_logistic_regression.
+
+    :param X: (array-like) features passed to perform_k_fold_logistic_regression
+    :param y: (array-like) targets passed to perform_k_fold_logistic_regression
+    :param fold: (dict) a fold from the results of perform_k_fold_logistic_regression
+    :returns: X_train, X_test, y_train, y_test
+    """
+    train_idx, test_idx = fold['train_idx'], fold['test_idx']
+    return _take_rows(X, train_idx), _take_rows(X, test_idx), _take_rows(y, train_idx), _take_rows(y, test_idx)
+
+
+def _log_likelihood(prob, y_idx, n_classes):
+    """
+    Returns the total log likelihood of encoded labels under predicted probabilities. 
+    Equivalent to -log_loss(y_true, prob) * len(y_true), without sklearn's per-call validation and label encoding.
+
+    :param prob: (N x C array) predicted probabilities, or (N,) probabilities of the positive class if C = 2
+    :param y_idx: (N,) index of the true class of each sample, in sorted class order
+    :param n_classes: (int) number of classes in y_true
+    """
+    prob = np.asarray(prob, dtype=float)
+    if prob.ndim == 1:
+        prob = np.column_stack([1 - prob, prob])
+    if prob.shape[1] != n_classes:
+        raise ValueError(f'y_true has {n_classes} classes, but prob has {prob.shape[1]} columns.')
+    p_true = np.take_along_axis(prob, y_idx[:, None], axis=1).ravel()
+    eps = np.finfo(prob.dtype).eps
+    return np.log(np.clip(p_true, eps, 1 - eps)).sum()
+
+
 def likelihood_ratio_test(prob_full, prob_reduced, coef_full, coef_reduced, y_true):
     """
     Performs a likelihood ratio test given the probabilities from the full and reduced models,
@@ -153,9 +244,11 @@ def likelihood_ratio_test(prob_full, prob_reduced, coef_full, coef_reduced, y_tr
     - 'degrees_of_freedom': Degrees of freedom (difference in the number of parameters).
     - 'p_value': P-value of the test statistic.
     """
-    # Calculate the total negative log loss (negative of the average log likelihood)
-    log_likelihood_full = -log_loss(y_true, prob_full) * len(y_true)
-    log_likelihood_reduced = -log_loss(y_true, prob_reduced) * len(y_true)
+    # Calculate the total log likelihood (negative of the total log loss)
+    # labels are encoded once, as sklearn's log_loss would, and shared by both models
+    classes, y_idx = np.unique(np.asarray(y_true).ravel(), return_inverse=True)
+    log_likelihood_full = _log_likelihood(prob_full, y_idx, len(classes))
+    log_likelihood_reduced = _log_likelihood(prob_reduced, y_idx, len(classes))
     
     # Compute the test statistic
     test_statistic = -2 * (log_likelihood_reduced - log_likelihood_full)
@@ -209,7 +302,7 @@ def likelihood_ratio_test_from_estimator(model_full, model_reduced, X_full, X_re
 def get_coefficients(model):
     if hasattr(model, 'coef_'):
         return model.coef_
-    elif 'steps' in dir(model):  # It's a Pipeline
+    elif hasattr(model, 'steps'):  # It's a Pipeline
         # Assuming the last step is the estimator
         return model.steps[-1][1].coef_
     else:
@@ -279,17 +372,22 @@ def paired_ttest_5x2cv(estimator1, estimator2, X, y, scoring=None, random_seed=N
     variance_sum = 0.0
     first_diff = None
 
-    indices = np.arange(X.shape[0])
+    n_samples = X.shape[0]
+    half = n_samples // 2
+    y = np.asarray(y)
+    fit1, fit2 = estimator1.fit, estimator2.fit
     
     # Perform 5x2 CV
     for i in range(5):
-        randint = rng.randint(low=0, high=32767)
-        indices_A, indices_B, y_A, y_B = train_test_split(indices, y, test_size=0.5, random_state=randint)
+        # split the samples in half with a permutation
+        perm = rng.permutation(n_samples)
+        indices_A, indices_B = perm[:half], perm[half:]
+        y_A, y_B = y[indices_A], y[indices_B]
         X1_A, X1_B = X[indices_A], X[indices_B]
         X2_A, X2_B = (X2[indices_A], X2[indices_B]) if X2 is not None else (X1_A, X1_B)
 
-        score_diff_1 = scorer(estimator1.fit(X1_A, y_A), X1_B, y_B) - scorer(estimator2.fit(X2_A, y_A), X2_B, y_B)
-        score_diff_2 = scorer(estimator1.fit(X1_B, y_B), X1_A, y_A) - scorer(estimator2.fit(X2_B, y_B), X2_A, y_A)
+        score_diff_1 = scorer(fit1(X1_A, y_A), X1_B, y_B) - scorer(fit2(X2_A, y_A), X2_B, y_B)
+        score_diff_2 = scorer(fit1(X1_B, y_B), X1_A, y_A) - scorer(fit2(X2_B, y_B), X2_A, y_A)
         score_mean = (score_diff_1 + score_diff_2) / 2.0
         score_var = (score_diff_1 - score_mean) ** 2 + (score_diff_2 - score_mean) ** 2
         variance_sum += score_var
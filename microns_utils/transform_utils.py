@@ -2,6 +2,8 @@
 Utilities for transformations, adjustments, and registrations of MICrONS volumes.
 """
 
+import math
+from functools import lru_cache
 import numpy as np
 from scipy.stats import gaussian_kde
 from scipy import ndimage
@@ -10,7 +12,7 @@ from .misc_utils import wrap
 
 def format_coords(coords_xyz, return_dim=1):
     # format coordinates 
-    coords_xyz = np.array(coords_xyz)
+    coords_xyz = np.asarray(coords_xyz)
     
     assert return_dim == 1 or return_dim == 2, "return_dim must be 1 or 2"
     assert coords_xyz.ndim == 1 or coords_xyz.ndim == 2, 'coords_xyz.ndim must be 1 or 2'
@@ -28,11 +30,38 @@ def normalize(points, points_min, points_max, new_min, new_max):
     return (points - points_min) * ((new_max - new_min) / (points_max - points_min)) + new_min
 
 
+def _normalize_in_float32(dtype, lo, hi, newrange, astype):
+    """
+    Returns True if normalize_image gives the same result computed in float32 as in float64.
+
+    This holds for integer images and ranges when the image values are below 2**24, so they convert to float32 exactly, 
+        and every intermediate value, scaled by the image range, also stays below 2**24: 
+        the subtraction and multiplication are then exact, and float32 rounding of the division and offset can't cross an integer. 
+    The output must also be no wider than float32.
+    """
+    astype = np.dtype(astype)
+    if dtype.kind not in 'biu' or (astype.kind not in 'biu' and astype.itemsize > 4):
+        return False
+    if not all(float(v).is_integer() for v in newrange):
+        return False
+    if max(abs(int(lo)), abs(int(hi))) >= 2**24:
+        return False
+    bound = max(abs(newrange[1] - newrange[0]), abs(newrange[0]), abs(newrange[1]))
+    return (int(hi) - int(lo)) * bound < 2**24
+
+
 def normalize_image(image, newrange=[0, 255], clip_bounds=None, astype=np.uint8):
-    image = np.array(image)
+    image = np.asarray(image)
     if clip_bounds is not None:
         image = np.clip(image,clip_bounds[0], clip_bounds[1]) 
-    return (((image - image.min())*(newrange[1]-newrange[0])/(image.max() - image.min())) + newrange[0]).astype(astype)
+    lo, hi = image.min(), image.max()
+    dtype = np.float32 if _normalize_in_float32(image.dtype, lo, hi, newrange, astype) else np.float64
+    lo, hi = dtype(lo), dtype(hi)
+    out = np.subtract(image, lo, dtype=dtype)
+    out *= newrange[1] - newrange[0]
+    out /= hi - lo
+    out += newrange[0]
+    return out.astype(astype, copy=False)
 
 
 def lcn(image, sigmas=(12, 12)):
@@ -66,7 +95,7 @@ def sharpen_2pimage(image, laplace_sigma=0.7, low_percentile=3, high_percentile=
     return norm
 
 
-def run_kde(data, nbins, bounds='auto', method='gaussian_kde', method_kws=None):
+def run_kde(data, nbins, bounds='auto', method='gaussian_kde', method_kws=None, chunk_size=4096):
     """
     Generate kernel density estimation from data
     
@@ -85,11 +114,15 @@ def run_kde(data, nbins, bounds='auto', method='gaussian_kde', method_kws=None):
             "gaussian_kde" : scipy.stats.gaussian_kde
     method_kws : dict
         kws to pass to kde method
+    chunk_size : int or None
+        maximum number of grid points to evaluate the kde pdf at once, which bounds memory use for large data. 
+        None evaluates all grid points at once.
     Returns
         grid, kde pdf evaluated over grid
     """
     method_options = ['gaussian_kde']
     method_kws = {} if method_kws is None else method_kws
+    data = np.ascontiguousarray(data, dtype=np.float64)
     if bounds == 'auto':
         min_bound = data.min()
         max_bound = data.max()
@@ -99,7 +132,12 @@ def run_kde(data, nbins, bounds='auto', method='gaussian_kde', method_kws=None):
     if method in method_options:
         if method == 'gaussian_kde':
             kde = gaussian_kde(data, **method_kws)
-            return grid, kde.pdf(grid).reshape(grid.shape)
+            if chunk_size is None or nbins <= chunk_size:
+                return grid, kde.evaluate(grid)
+            pdf = np.empty(nbins)
+            for i in range(0, nbins, chunk_size):
+                pdf[i:i + chunk_size] = kde.evaluate(grid[i:i + chunk_size])
+            return grid, pdf
     else:
         raise AttributeError(f'method {method} not supported. Options are {method_options}')
     
@@ -195,6 +233,29 @@ def make_grid(bounds, axis=None, *, npts=None, step=None, clip_bounds_dict=None,
     )
 
 
+@lru_cache(maxsize=256)
+def _rotation_matrix(cols, angles):
+    """
+    Composes rotations about the columns in cols by angles (radians) into one 3x3 matrix. 
+
+    The result is cached and read-only, as the same rotation is typically applied repeatedly (e.g. by sklearn_utils.RotationTransformer).
+    """
+    R = np.eye(3)
+    for col, angle in zip(cols, angles):
+        c, s = math.cos(angle), math.sin(angle)
+        if col == 0:
+            Rc = np.array([[1, 0, 0], [0, c, -s], [0, s, c]])
+        elif col == 1:
+            Rc = np.array([[c, 0, s], [0, 1, 0], [-s, 0, c]])
+        elif col == 2:
+            Rc = np.array([[c, -s, 0], [s, c, 0], [0, 0, 1]])
+        else:
+            raise AttributeError(f'column {col} not supported')
+        R = Rc @ R
+    R.flags.writeable = False
+    return R
+
+
 def rotate_points_3d(points, cols, degrees, decimals=3):
     """  
     Rotates about one or more columns of an Nx3 array
@@ -213,45 +274,12 @@ def rotate_points_3d(points, cols, degrees, decimals=3):
     returns: Nx3 numpy array (float)
         rotated points
     """
-    points = np.array(points)
+    points = np.asarray(points)
     assert points.ndim == 2 and points.shape[1] == 3, 'points must be Nx3'
     # make iterable given int, list, tuple or ndarray
     cols = wrap(np.array(cols).tolist())
     angles = wrap((np.array(degrees) * np.pi / 180).tolist())
     assert len(cols) == len(angles), 'cols and degrees must be the same len'
 
-    def rotate0(points, angle):
-        rotated = points.copy().astype(float)
-        rotated[..., 1] = points[..., 1] * \
-            np.cos(angle) - points[..., 2] * np.sin(angle)
-        rotated[..., 2] = points[..., 1] * \
-            np.sin(angle) + points[..., 2] * np.cos(angle)
-        return rotated.round(decimals=decimals)
-
-    def rotate1(points, angle):
-        rotated = points.copy().astype(float)
-        rotated[..., 0] = points[..., 0] * \
-            np.cos(angle) + points[..., 2] * np.sin(angle)
-        rotated[..., 2] = points[..., 2] * \
-            np.cos(angle) - points[..., 0] * np.sin(angle)
-        return rotated.round(decimals=decimals)
-
-    def rotate2(points, angle):
-        rotated = points.copy().astype(float)
-        rotated[..., 0] = points[..., 0] * \
-            np.cos(angle) - points[..., 1] * np.sin(angle)
-        rotated[..., 1] = points[..., 0] * \
-            np.sin(angle) + points[..., 1] * np.cos(angle)
-        return rotated.round(decimals=decimals)
-
-    for col, angle in zip(cols, angles):
-        if col == 0:
-            points = rotate0(points, angle)
-        if col == 1:
-            points = rotate1(points, angle)
-        if col == 2:
-            points = rotate2(points, angle)
-        if col not in (0, 1, 2):
-            raise AttributeError(f'column {col} not supported')
-
-    return points
\ No newline at end of file
+    rotated = points @ _rotation_matrix(tuple(cols), tuple(angles)).T
+    return np.round(rotated, decimals, out=rotated)
\ No newline at end of file
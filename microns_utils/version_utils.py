@@ -2,8 +2,6 @@
 Methods for checking installed and latest versions of microns packages.
 """
 
-import traceback
-import requests
 from .misc_utils import wrap
 try:
     from importlib import metadata
@@ -13,11 +11,86 @@ import logging
 import re
 import sys
 import json
+import os
+import threading
+import time
+from functools import lru_cache
 from pathlib import Path
 from .filepath_utils import find_all_matching_files
 
 logger = logging.getLogger(__name__)
 
+github_version_cache_ttl = 3600 # seconds after which a cached Github version is refreshed in the background
+github_version_cache_path = Path.home().joinpath('.cache', 'microns_utils', 'gh_version.json')
+github_request_timeout = 5 # seconds
+_github_version_cache = {}
+_github_version_refreshing = set()
+_github_version_refreshing_lock = threading.Lock()
+_version_line_re = re.compile(r'__version__.*')
+_semver_re = re.compile(r"^(0|[1-9]\d*)\.(0|[1-9]\d*)\.(0|[1-9]\d*)(?:-((?:0|[1-9]\d*|\d*[a-zA-Z-][0-9a-zA-Z-]*)(?:\.(?:0|[1-9]\d*|\d*[a-zA-Z-][0-9a-zA-Z-]*))*))?(?:\+([0-9a-zA-Z-]+(?:\.[0-9a-zA-Z-]+)*))?$")
+
+
+def _read_github_version_cache_file():
+    """
+    Returns the contents of the on-disk Github version cache, or an empty dict if it can't be read.
+    """
+    try:
+        with open(github_version_cache_path) as f:
+            cache = json.load(f)
+        return cache if isinstance(cache, dict) else {}
+    except (OSError, ValueError):
+        return {}
+
+
+def _write_github_version_cache_file(key, latest, fetched_at):
+    """
+    Adds a version to the on-disk Github version cache. Failures are logged and ignored.
+    """
+    cache = _read_github_version_cache_file()
+    cache[key] = {'value': latest, 'ts': fetched_at}
+    tmp_path = github_version_cache_path.with_suffix(f'.{os.getpid()}.tmp')
+    try:
+        github_version_cache_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(tmp_path, 'w') as f:
+            json.dump(cache, f)
+        os.replace(tmp_path, github_version_cache_path)
+    except OSError:
+        logger.debug(f'Could not write Github version cache to {github_version_cache_path}.')
+
+
+def _store_github_version(key, latest):
+    """
+    Stores a version fetched from Github in the in-memory and on-disk caches.
+    """
+    fetched_at = time.time()
+    _github_version_cache[key] = (latest, fetched_at)
+    _write_github_version_cache_file(key, latest, fetched_at)
+
+
+def _refresh_github_version(key, **kwargs):
+    """
+    Fetches the latest version from Github and updates the caches. On failure, the stale version is kept.
+    """
+    try:
+        latest = _fetch_latest_version_from_github(**kwargs, warn=False)
+        if latest:
+            _store_github_version(key, latest)
+    finally:
+        with _github_version_refreshing_lock:
+            _github_version_refreshing.discard(key)
+
+
+def _refresh_github_version_in_background(key, **kwargs):
+    """
+    Starts a daemon thread to refresh a cached Github version, unless one is already running for key.
+    """
+    with _github_version_refreshing_lock:
+        if key in _github_version_refreshing:
+            return
+        _github_version_refreshing.add(key)
+    threading.Thread(target=_refresh_github_version, args=(key,), kwargs=kwargs, daemon=True).start()
+
+
 def parse_version(text: str):
     """
     Extracts __version__ from raw text if __version__ follows semantic versioning (https://semver.org/).
@@ -27,15 +100,14 @@ def parse_version(text: str):
     :param text (str): the text containing the version.
     :returns (str): version if parsed successfully else ""
     """
-    semver = "^(0|[1-9]\d*)\.(0|[1-9]\d*)\.(0|[1-9]\d*)(?:-((?:0|[1-9]\d*|\d*[a-zA-Z-][0-9a-zA-Z-]*)(?:\.(?:0|[1-9]\d*|\d*[a-zA-Z-][0-9a-zA-Z-]*))*))?(?:\+([0-9a-zA-Z-]+(?:\.[0-9a-zA-Z-]+)*))?$"
-    version_search = re.search('__version__.*', text)
+    version_search = _version_line_re.search(text)
     text = version_search.group() if version_search is not None else text
     text = text.split('=')[1].strip(' "'" '") if len(text.split('='))>1 else text.strip(' "'" '")
-    parsed = re.search(semver, text)
+    parsed = _semver_re.search(text)
     return parsed.group() if parsed else ""
 
 
-def check_latest_version_from_github(owner, repo, source, branch='main', path_to_version_file=None, warn=True):
+def check_latest_version_from_github(owner, repo, source, branch='main', path_to_version_file=None, warn=True, use_cache=True):
     """
     Checks github for the latest version of package.
 
@@ -49,25 +121,53 @@ def check_latest_version_from_github(owner, repo, source, branch='main', path_to
     :param branch (str): Branch of repository if source='commit', defaults to 'main'.
     :param path_to_version_file (str): Path to version.py file from top of repo if source = "commit". 
     :param warn (bool): If true, warnings enabled.
+    :param use_cache (bool): If true, returns the cached version if available without waiting on Github. 
+        If the cached version is older than `github_version_cache_ttl` seconds, it is still returned, and refreshed in a background thread.
+        Fetched versions are also stored at `github_version_cache_path`, so the cache persists across processes.
     :returns (str): If successful, returns latest version, otherwise returns "".
     """
+    key = json.dumps([owner, repo, source, branch, path_to_version_file])
+    kwargs = dict(owner=owner, repo=repo, source=source, branch=branch, path_to_version_file=path_to_version_file)
+    if use_cache:
+        cached = _github_version_cache.get(key)
+        if cached is None:
+            on_disk = _read_github_version_cache_file().get(key)
+            if isinstance(on_disk, dict) and 'value' in on_disk and 'ts' in on_disk:
+                cached = _github_version_cache[key] = (on_disk['value'], on_disk['ts'])
+        if cached is not None:
+            if time.time() - cached[1] >= github_version_cache_ttl:
+                _refresh_github_version_in_background(key, **kwargs)
+            return cached[0]
+
+    latest = _fetch_latest_version_from_github(**kwargs, warn=warn)
+    if latest:
+        _store_github_version(key, latest)
+    return latest
+
+
+def _fetch_latest_version_from_github(owner, repo, source, branch='main', path_to_version_file=None, warn=True):
+    """
+    Requests the latest version of package from Github. See check_latest_version_from_github for params.
+    """
     latest = ""
     try:
+        import requests # imported here as it is only needed for Github requests and is slow to import
+
         if source == 'commit':
             assert branch is not None, 'Provide branch if source = "commit".'
             assert path_to_version_file is not None, 'Provide path_to_version_file if source = "commit".'
-            f = requests.get(f"https://raw.githubusercontent.com/{owner}/{repo}/{branch}/{path_to_version_file}")
+            f = requests.get(f"https://raw.githubusercontent.com/{owner}/{repo}/{branch}/{path_to_version_file}", timeout=github_request_timeout)
             latest = parse_version(f.text)
             
         elif source == 'tag':
-            f = requests.get(f"https://api.github.com/repos/{owner}/{repo}/tags")
+            f = requests.get(f"https://api.github.com/repos/{owner}/{repo}/tags", timeout=github_request_timeout)
             if not f.ok:
                 logger.error(f'Could not check Github version because: "{f.reason}".')
                 return latest
             latest = parse_version(json.loads(f.text)[0]['name'][1:])
             
         elif source == 'release':
-            f = requests.get(f"https://api.github.com/repos/{owner}/{repo}/releases")
+            f = requests.get(f"https://api.github.com/repos/{owner}/{repo}/releases", timeout=github_request_timeout)
             if not f.ok:
                 logger.error(f'Could not check Github version because: "{f.reason}".')
                 return latest
@@ -75,10 +175,9 @@ def check_latest_version_from_github(owner, repo, source, branch='main', path_to
         
         else:
             raise ValueError(f'source: "{source}" not recognized. Options include: "commit", "tag", "release". ')
-    except:
+    except Exception:
         if warn:
-            logger.warning('Failed to check latest version from Github.')
-            traceback.print_exc()
+            logger.warning('Failed to check latest version from Github.', exc_info=True)
 
     return latest
 
@@ -90,7 +189,7 @@ def latest_github_version_checker(owner, repo):
     :param owner (str): Owner of repository
     :param repo (str): Name of repository that contains package
     """
-    def inner(source='tag', branch=None, path_to_version_file=None, warn=True):
+    def inner(source='tag', branch=None, path_to_version_file=None, warn=True, use_cache=True):
         """
         :param source (str): 
             options: 
@@ -100,26 +199,46 @@ def latest_github_version_checker(owner, repo):
         :param branch (str): Branch of repository if source='commit', defaults to 'main'.
         :param path_to_version_file (str): Path to version.py file from top of repo if source = "commit". 
         :param warn (bool): If true, warnings enabled.
+        :param use_cache (bool): If true, returns the cached version if available. See check_latest_version_from_github.
         :returns (str): If successful, returns latest version, otherwise returns "".
         """
-        return check_latest_version_from_github(owner=owner, repo=repo, source=source, branch=branch, path_to_version_file=path_to_version_file, warn=warn) 
+        return check_latest_version_from_github(owner=owner, repo=repo, source=source, branch=branch, path_to_version_file=path_to_version_file, warn=warn, use_cache=use_cache) 
     return inner
 
 
+@lru_cache(maxsize=None)
+def _distribution_version(package):
+    """
+    Returns the installed version of package from importlib metadata, or None if it is not found. Cached per package.
+    """
+    try:
+        return metadata.version(package)
+    except metadata.PackageNotFoundError:
+        return None
+
+
+def _clear_version_cache():
+    """
+    Clears the cached installed versions, e.g. after installing or upgrading packages in a running session.
+    """
+    _distribution_version.cache_clear()
+
+
 def check_package_version_from_distributions(package, warn=True):
     """
     Checks importlib metadata for an installed version of the package. 
     Note: packages installed as editable (i.e. pip install -e) will not be found.
+    Versions are cached per process, see _clear_version_cache.
 
     :param package (str): name of package:
     :returns (str):  If successful, returns version, otherwise returns "".
     """
-    version = [dist.version for dist in metadata.distributions() if dist.metadata["Name"] == package]
-    if not version:
+    version = _distribution_version(package)
+    if version is None:
         if warn:
             logger.warning('Package not found in distributions.')
         return ''
-    return version[0]
+    return version
 
 
 def check_package_version_from_sys_path(package, path_to_version_file, prefix='', warn=True):